@@ -0,0 +1,107 @@
+"""
+Admission control for the Medical RAG API
+A fixed number of pipeline slots behind a bounded wait queue; requests beyond that are rejected with a retry hint
+"""
+
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class Rejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and a Retry-After hint (seconds)"""
+
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    ``slots`` requests run the pipeline at once; up to ``queue_size`` more
+    wait for a slot (FIFO) for at most ``queue_timeout_s``.
+
+    Rejections:
+        429  the wait queue is full
+        503  a queued request timed out before a slot freed up
+
+    Retry-After is estimated from the moving average of slot hold time and
+    the number of requests ahead. Requests that never call ``acquire``
+    (health, auth, chat history) are unaffected, so they stay responsive
+    while RAG requests are queued.
+    """
+
+    def __init__(self, slots: int = 2, queue_size: int = 8, queue_timeout_s: float = 30.0):
+        if slots < 1:
+            raise ValueError("slots must be >= 1")
+        self.slots = slots
+        self.queue_size = queue_size
+        self.queue_timeout_s = queue_timeout_s
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []  # tickets in arrival order
+        self._next_ticket = 0
+        self._mean_hold_s = None
+        self.counters = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    def _retry_after(self, ahead: int) -> int:
+        hold = self._mean_hold_s or 1.0
+        return max(1, math.ceil(hold * (ahead + 1) / self.slots))
+
+    def acquire(self) -> Callable[[], None]:
+        """Block until a slot is free; returns an idempotent release function. Raises Rejected."""
+        with self._cond:
+            if self._active >= self.slots or self._waiting:
+                if len(self._waiting) >= self.queue_size:
+                    self.counters["rejected_full"] += 1
+                    raise Rejected(429, self._retry_after(len(self._waiting)), "Too many requests in queue")
+                ticket = self._next_ticket
+                self._next_ticket += 1
+                self._waiting.append(ticket)
+                self.counters["queued"] += 1
+                deadline = time.monotonic() + self.queue_timeout_s
+                while self._active >= self.slots or self._waiting[0] != ticket:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        ahead = self._waiting.index(ticket)
+                        self._waiting.remove(ticket)
+                        self._cond.notify_all()
+                        self.counters["rejected_timeout"] += 1
+                        raise Rejected(503, self._retry_after(ahead), "Timed out waiting for a pipeline slot")
+                    self._cond.wait(remaining)
+                self._waiting.pop(0)
+            self._active += 1
+            self.counters["admitted"] += 1
+
+        started = time.monotonic()
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            held = time.monotonic() - started
+            with self._cond:
+                self._active -= 1
+                self._mean_hold_s = held if self._mean_hold_s is None else 0.8 * self._mean_hold_s + 0.2 * held
+                self._cond.notify_all()
+
+        return release
+
+    @contextmanager
+    def admit(self):
+        release = self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(self.counters, slots=self.slots, active=self._active, waiting=len(self._waiting),
+                        queue_size=self.queue_size,
+                        mean_hold_s=round(self._mean_hold_s, 3) if self._mean_hold_s is not None else None)
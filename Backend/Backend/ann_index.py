@@ -0,0 +1,93 @@
+"""
+Approximate FAISS index variants for the Medical RAG pipeline
+Builds IVF-Flat / IVF-PQ / HNSW indexes from the exact flat vectors and applies runtime search knobs
+"""
+
+import math
+import numpy as np
+import faiss
+
+
+ANN_INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def default_nlist(n_vectors: int) -> int:
+    """~4*sqrt(n) lists, capped so every list gets enough training points (39 per centroid)"""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def build_ann_index(vectors: np.ndarray, kind: str, metric: int = faiss.METRIC_INNER_PRODUCT,
+                    nlist: int = None, pq_m: int = 48, pq_nbits: int = 8,
+                    hnsw_m: int = 32, ef_construction: int = 200) -> faiss.Index:
+    """Build one index variant over `vectors` (float32, shape (n, dim))"""
+    if kind not in ANN_INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {ANN_INDEX_TYPES}")
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+
+    if kind == "flat":
+        index = faiss.IndexFlat(dim, metric)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlat(dim, metric)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            if dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}")
+            if n < 2 ** pq_nbits:
+                raise ValueError(f"IVF-PQ needs at least {2 ** pq_nbits} vectors to train, got {n}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits, metric)
+        index.train(vectors)
+
+    index.add(vectors)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # Keeps reconstruct(id) available for IVF variants
+        ivf.make_direct_map()
+    return index
+
+
+def read_faiss_index(path: str, mmap: bool = False) -> faiss.Index:
+    """Read an index, memory-mapping its vectors/lists so processes share the page cache"""
+    if not mmap:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP_IFC (faiss >= 1.11) extends mmap from IVF lists to flat codes, but combined with
+    # IO_FLAG_MMAP it is rejected for IVF indexes ("mmap only supported for File objects"); those
+    # only need IO_FLAG_MMAP, which maps their inverted lists
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if ifc:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | ifc)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+
+
+def check_index_loads(path: str, index: faiss.Index = None, n_queries: int = 5) -> faiss.Index:
+    """
+    Read a written index back the way the pipeline serves it (memory-mapped) and
+    search it; with the in-memory `index`, the top hits must match. Raises RuntimeError.
+    """
+    loaded = read_faiss_index(path, mmap=True)
+    reference = index if index is not None else loaded
+    queries = reference.reconstruct_n(0, min(n_queries, reference.ntotal))
+    _, loaded_ids = loaded.search(queries, 5)
+    if index is not None:
+        _, ids = index.search(queries, 5)
+        if not np.array_equal(ids, loaded_ids):
+            raise RuntimeError(f"{path}: search results differ after reading the index back")
+    return loaded
+
+
+def apply_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None) -> faiss.Index:
+    """Set runtime recall/latency knobs; no-op for index types that do not use them"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = ef_search
+    return index
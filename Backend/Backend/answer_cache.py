@@ -0,0 +1,139 @@
+"""
+Semantic answer cache for the Medical RAG pipeline
+Serves stored run_query results for repeated or paraphrased questions (exact text tier + FAISS similarity tier)
+"""
+
+import copy
+import time
+import threading
+import numpy as np
+import faiss
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from generation_cache import normalize_query
+
+
+class SemanticAnswerCache:
+    """
+    Result cache in front of the full retrieve -> rerank -> generate chain.
+
+    Tiers:
+        exact     normalized question text (checked before the query is embedded)
+        semantic  inner-product search over cached query embeddings; a hit
+                  needs similarity >= ``threshold``, the same generation
+                  profile and the same routed domains
+
+    Entries expire after ``ttl_s``; beyond ``max_entries`` the least recently
+    used entry is evicted. ``invalidate_domain`` drops every entry whose
+    result drew on that domain (e.g. after its index is rebuilt).
+    """
+
+    def __init__(self, dim: int, max_entries: int = 2000, ttl_s: float = 3600.0,
+                 threshold: float = 0.92, search_k: int = 5):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.search_k = search_k
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "expired": 0,
+                         "evictions": 0, "invalidated": 0}
+
+    # --------------------------------------------------------------------
+    # Lookup
+    # --------------------------------------------------------------------
+    def _live(self, entry_id: int, now: float) -> Optional[Dict]:
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        if now - entry["created"] > self.ttl_s:
+            self._remove([entry_id])
+            self.counters["expired"] += 1
+            return None
+        return entry
+
+    def _hit(self, entry_id: int, tier: str, similarity: float) -> Dict:
+        self._entries.move_to_end(entry_id)
+        self.counters[f"{tier}_hits"] += 1
+        result = copy.deepcopy(self._entries[entry_id]["result"])
+        result["answer_cache"] = {"tier": tier, "similarity": round(similarity, 4)}
+        return result
+
+    def get_exact(self, query: str, profile: str) -> Optional[Dict]:
+        with self._lock:
+            entry_id = self._exact.get((normalize_query(query), profile))
+            if entry_id is not None and self._live(entry_id, time.time()) is not None:
+                return self._hit(entry_id, "exact", 1.0)
+            return None
+
+    def get_semantic(self, query_emb: np.ndarray, profile: str, domains: List[str]) -> Optional[Dict]:
+        """query_emb: (1, dim) L2-normalized float32. Counts a miss when nothing qualifies."""
+        with self._lock:
+            if self.index.ntotal:
+                D, I = self.index.search(query_emb, min(self.search_k, self.index.ntotal))
+                now = time.time()
+                for similarity, entry_id in zip(D[0], I[0]):
+                    if entry_id < 0 or similarity < self.threshold:
+                        break
+                    entry = self._live(int(entry_id), now)
+                    if entry is not None and entry["profile"] == profile and entry["domains"] == list(domains):
+                        return self._hit(int(entry_id), "semantic", float(similarity))
+            self.counters["misses"] += 1
+            return None
+
+    # --------------------------------------------------------------------
+    # Store / Evict
+    # --------------------------------------------------------------------
+    def put(self, query: str, query_emb: np.ndarray, profile: str, domains: List[str], result: Dict):
+        key = (normalize_query(query), profile)
+        with self._lock:
+            if key in self._exact:
+                self._remove([self._exact[key]])
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(np.ascontiguousarray(query_emb, dtype="float32"),
+                                    np.asarray([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "key": key,
+                "profile": profile,
+                "domains": list(domains),
+                "result_domains": {s.get("domain") for s in result.get("sources", [])} | set(domains),
+                "result": copy.deepcopy(result),
+                "created": time.time(),
+            }
+            self._exact[key] = entry_id
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self._entries)[:overflow])
+                self.counters["evictions"] += overflow
+
+    def _remove(self, entry_ids: List[int]):
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id)
+            if self._exact.get(entry["key"]) == entry_id:
+                del self._exact[entry["key"]]
+        self.index.remove_ids(np.asarray(entry_ids, dtype=np.int64))
+
+    def invalidate_domain(self, domain: str) -> int:
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if domain in e["result_domains"]]
+            if stale:
+                self._remove(stale)
+            self.counters["invalidated"] += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self._remove(list(self._entries))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            lookups = hits + self.counters["misses"]
+            return dict(self.counters, entries=len(self._entries),
+                        hit_rate=round(hits / lookups, 3) if lookups else 0.0)
@@ -3,13 +3,15 @@ MediRAG Backend - Flask API with Optimized Medical RAG Pipeline
 Uses multi-domains-medical-final-rag-model.py as the core engine
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import mysql.connector
 from datetime import datetime
 import os
 import sys
 import time
+import json
+import threading
 
 # Add current directory to Python path
 sys.path.append(os.path.dirname(__file__))
@@ -25,15 +27,55 @@ except Exception:
 from typing import Optional
 pipeline_instance: Optional[object] = None
 pipeline_initialized = False
+# Readiness: "not_started" -> "loading" -> "loaded" -> "warming" -> "ready" (or "failed");
+# RAG endpoints answer 503 until "ready"
+pipeline_state = "not_started"
+pipeline_error: Optional[str] = None
+warmup_timings: Optional[dict] = None
+_init_lock = threading.Lock()  # held for the whole load / warm-up
+_start_lock = threading.Lock()  # only guards starting the warm-up thread, so requests never wait on loading
+_warmup_thread: Optional[threading.Thread] = None
+# After a failed load, requests do not trigger a reload until this backoff passes (doubles per failure)
+INIT_RETRY_S = float(os.getenv("MEDIRAG_INIT_RETRY_S", "60"))
+MAX_INIT_RETRY_S = 1800.0
+_init_failures = 0
+_init_retry_at: Optional[float] = None  # time.monotonic() after which a request may start a reload
+# Set by prefork.py: forwards a cache invalidation to the sibling workers (their in-process caches are separate)
+invalidation_broadcast = None
 
 def initialize_rag_pipeline():
-    """Initialize the memory-efficient RAG pipeline once"""
-    global pipeline_instance, pipeline_initialized
-    
-    if pipeline_initialized:
-        print("[OK] Medical RAG Pipeline already initialized")
-        return True
-    
+    """Initialize the memory-efficient RAG pipeline once (thread-safe)"""
+    global pipeline_instance, pipeline_initialized, pipeline_state, pipeline_error
+    global _init_failures, _init_retry_at
+
+    with _init_lock:
+        if pipeline_initialized:
+            print("[OK] Medical RAG Pipeline already initialized")
+            return True
+        pipeline_state = "loading"
+        ok = _build_pipeline()
+        if ok:
+            pipeline_state, pipeline_error = "loaded", None
+            _init_failures, _init_retry_at = 0, None
+        else:
+            pipeline_state = "failed"
+            _init_failures += 1
+            backoff = min(INIT_RETRY_S * 2 ** (_init_failures - 1), MAX_INIT_RETRY_S)
+            _init_retry_at = time.monotonic() + backoff
+            print(f"   Next load attempt no sooner than {backoff:.0f}s from now")
+        return ok
+
+
+def init_retry_in() -> Optional[float]:
+    """Seconds until a failed pipeline may be reloaded (0 once due), None unless the load failed"""
+    if pipeline_state != "failed" or _init_retry_at is None:
+        return None
+    return round(max(0.0, _init_retry_at - time.monotonic()), 1)
+
+
+def _build_pipeline():
+    global pipeline_instance, pipeline_initialized, pipeline_error
+
     try:
         print("\n" + "="*80)
         print("*** INITIALIZING OPTIMIZED MEDICAL RAG PIPELINE ***")
@@ -59,6 +101,7 @@ def initialize_rag_pipeline():
         return True
         
     except Exception as e:
+        pipeline_error = str(e)
         print(f"\n[ERROR] ERROR INITIALIZING RAG PIPELINE:")
         print(f"   {str(e)}")
         print("   Backend will start but RAG queries will fail")
@@ -66,9 +109,82 @@ def initialize_rag_pipeline():
         return False
 
 
+def warm_up_pipeline():
+    """Initialize (if needed), run one warm-up query through every model, then mark the pipeline ready"""
+    global pipeline_state, pipeline_error, warmup_timings
+
+    if not initialize_rag_pipeline():
+        return False
+    with _init_lock:
+        if pipeline_state == "ready":
+            return True
+        pipeline_state = "warming"
+        try:
+            warmup_timings = pipeline_instance.warm_up()
+        except Exception as e:
+            # A failed warm-up only means the first request is slower; the pipeline itself is usable
+            print(f"⚠️ Warm-up failed: {e}")
+            pipeline_error = f"warm-up failed: {e}"
+        pipeline_state = "ready"
+        print("[OK] MEDICAL RAG PIPELINE READY FOR TRAFFIC")
+        return True
+
+
+def start_background_init():
+    """
+    Load and warm the pipeline on a background thread; no-op while one is running,
+    once ready, or while a failed load is backing off (see INIT_RETRY_S)
+    """
+    global _warmup_thread
+
+    with _start_lock:
+        if pipeline_state == "ready" or (_warmup_thread is not None and _warmup_thread.is_alive()):
+            return
+        if init_retry_in():
+            return
+        _warmup_thread = threading.Thread(target=warm_up_pipeline, name="rag-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def _not_ready():
+    """503 while the pipeline is loading or warming up (starts loading if nothing has yet, or a retry is due)"""
+    start_background_init()
+    retry_in = init_retry_in()
+    if retry_in:
+        retry_after = max(1, int(retry_in + 0.999))
+        response = jsonify({"error": "RAG pipeline failed to initialize", "pipeline_state": pipeline_state,
+                            "pipeline_error": pipeline_error, "retry_after": retry_after})
+    else:
+        retry_after = 10
+        response = jsonify({"error": "RAG pipeline is starting up, please retry shortly",
+                            "pipeline_state": pipeline_state, "retry_after": retry_after})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 503
+
+
 app = Flask(__name__)
 CORS(app)
 
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+
+from admission import AdmissionController, Rejected
+
+# Pipeline slots bound concurrent RAG work (and memory); extra requests wait in a bounded queue
+PIPELINE_SLOTS = int(os.getenv("MEDIRAG_PIPELINE_SLOTS", "2"))
+QUEUE_SIZE = int(os.getenv("MEDIRAG_QUEUE_SIZE", "8"))
+QUEUE_TIMEOUT_S = float(os.getenv("MEDIRAG_QUEUE_TIMEOUT_S", "30"))
+admission = AdmissionController(PIPELINE_SLOTS, QUEUE_SIZE, QUEUE_TIMEOUT_S)
+
+
+def _rejected(e: Rejected):
+    """429/503 response with Retry-After for a request that was not admitted"""
+    response = jsonify({"error": e.reason, "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
+
+
 # ============================================================================
 # DATABASE CONNECTION
 # ============================================================================
@@ -88,6 +204,14 @@ def get_db_connection():
 db = get_db_connection()
 cursor = db.cursor(dictionary=True)
 
+
+def reconnect_db():
+    """Replace the module-level connection (a forked worker must not share its parent's socket)"""
+    global db, cursor
+    db = get_db_connection()
+    cursor = db.cursor(dictionary=True)
+
+
 # Create chat_history table with session support
 cursor.execute("""
 CREATE TABLE IF NOT EXISTS chat_history (
@@ -386,30 +510,39 @@ def ask():
     """
     global pipeline_instance, pipeline_initialized
 
-    # Ensure pipeline is ready
-    if not pipeline_initialized or pipeline_instance is None:
-        print("⚙️ Initializing Medical RAG pipeline...")
-        initialize_rag_pipeline()
+    # Never load models inside a request: answer 503 until the background warm-up has finished
+    if pipeline_state != "ready":
+        return _not_ready()
 
     data = request.get_json()
     query = data.get("query", "").strip()
     user_id = data.get("user_id", None)
     session_id = data.get("session_id", None)
+    profile = data.get("profile", None)
 
     if not query:
         return jsonify({"error": "Query is required"}), 400
+    profile_error = _check_profile(profile)
+    if profile_error:
+        return profile_error
 
     print(f"\n{'='*80}")
     print(f"📩 RAG Query Received: {query}")
     print(f"{'='*80}")
 
+    try:
+        release = admission.acquire()
+    except Rejected as e:
+        print(f"⏳ Rejected ({e.status}): {e.reason}, retry after {e.retry_after}s")
+        return _rejected(e)
+
     try:
         start = time.time()
 
         # ✅ Call the RAG pipeline safely
         result = None
         if hasattr(pipeline_instance, "run_query"):
-            result = pipeline_instance.run_query(query)
+            result = pipeline_instance.run_query(query, profile=profile)
         elif hasattr(pipeline_instance, "query"):
             result = pipeline_instance.query(query)
 
@@ -429,10 +562,15 @@ def ask():
             "query": result.get("query", query),
             "answer": result.get("answer", "No answer generated."),
             "domains": result.get("domains", []),
+            "routing": result.get("routing"),
             "confidence": result.get("metrics", {}).get("composite", 0.0),
+            "grading": result.get("grading"),
             "processing_time": result.get("processing_time", elapsed),
             "sources": result.get("sources", []),
-            "is_emergency": result.get("is_emergency", False)
+            "is_emergency": result.get("is_emergency", False),
+            "rerank": result.get("rerank", {}),
+            "generation": result.get("generation", {}),
+            "answer_cache": result.get("answer_cache")
         }
 
         print(f"✅ Answer ready in {elapsed}s (confidence: {response['confidence']:.2f})")
@@ -451,6 +589,84 @@ def ask():
             "confidence": 0.0
         }), 500
 
+    finally:
+        release()
+
+
+def _check_profile(profile):
+    """400 response for an unknown generation profile, else None"""
+    from generation import GENERATION_PROFILES
+
+    if profile is not None and profile not in GENERATION_PROFILES:
+        return jsonify({"error": f"Unknown profile '{profile}'. Use one of: {', '.join(GENERATION_PROFILES)}"}), 400
+    return None
+
+
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload, default=float)}\n\n"
+
+
+@app.route("/api/ask/stream", methods=["POST"])
+def ask_stream():
+    """
+    Streaming RAG endpoint (Server-Sent Events)
+
+    Events:
+        metadata  domains, sources, is_emergency - sent once retrieval and reranking finish
+        token     {"text": ...} decoded answer deltas
+        done      final answer, confidence, is_emergency, processing_time
+        error     {"error": ...} if the pipeline fails mid-stream
+    """
+    global pipeline_instance, pipeline_initialized
+
+    if pipeline_state != "ready":
+        return _not_ready()
+
+    data = request.get_json()
+    query = data.get("query", "").strip()
+    profile = data.get("profile", None)
+
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    profile_error = _check_profile(profile)
+    if profile_error:
+        return profile_error
+
+    print(f"\n{'='*80}")
+    print(f"📩 RAG Stream Query Received: {query}")
+    print(f"{'='*80}")
+
+    try:
+        release = admission.acquire()
+    except Rejected as e:
+        print(f"⏳ Rejected ({e.status}): {e.reason}, retry after {e.retry_after}s")
+        return _rejected(e)
+
+    def events():
+        stream = pipeline_instance.stream_query(query, profile=profile)
+        try:
+            for event, payload in stream:
+                yield _sse(event, payload)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            print(f"❌ Error in /api/ask/stream: {e}")
+            yield _sse("error", {"error": f"An internal error occurred while processing your question: {e}"})
+        finally:
+            # On client disconnect, closing the pipeline stream cancels and joins the decode thread,
+            # so the slot is only released once generation has actually stopped
+            stream.close()
+            release()
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Disable proxy buffering (nginx) so tokens arrive as generated
+    })
+    # The slot is held until the stream ends; also free it if the client goes away before the first event
+    response.call_on_close(release)
+    return response
+
 
 @app.route("/api/rag/query", methods=["POST"])
 def rag_query():
@@ -466,16 +682,32 @@ def health_check():
     Health check endpoint
     Returns system status and available domains
     """
-    global pipeline_initialized
+    global pipeline_instance, pipeline_initialized
     
     try:
         from multi_domains_medical_final_rag_model import DOMAINS
         
         return jsonify({
             "status": "healthy",
+            "ready": pipeline_state == "ready",
+            "pipeline_state": pipeline_state,
+            "pipeline_error": pipeline_error,
+            "init_retry_in_s": init_retry_in(),
+            "warmup": warmup_timings,
             "pipeline_initialized": pipeline_initialized,
             "available_domains": len(DOMAINS) if pipeline_initialized else 0,
             "domain_names": [d.name for d in DOMAINS] if pipeline_initialized else [],
+            "generation_cache": pipeline_instance.generation_cache.stats()
+                                if getattr(pipeline_instance, "generation_cache", None) else None,
+            "answer_cache": pipeline_instance.answer_cache.stats()
+                            if getattr(pipeline_instance, "answer_cache", None) else None,
+            "embedding_cache": pipeline_instance.embedding_cache.stats()
+                               if getattr(pipeline_instance, "embedding_cache", None) else None,
+            "shared_cache": pipeline_instance.shared_cache.stats()
+                            if getattr(pipeline_instance, "shared_cache", None) else None,
+            "admission": admission.stats(),
+            "domain_residency": pipeline_instance.loaded_domains.report()
+                                if hasattr(getattr(pipeline_instance, "loaded_domains", None), "report") else None,
             "timestamp": datetime.now().isoformat()
         }), 200
         
@@ -487,6 +719,28 @@ def health_check():
         }), 500
 
 
+@app.route("/api/cache/invalidate", methods=["POST"])
+def invalidate_cache():
+    """
+    Drop cached answers for one domain, e.g. after its index was rebuilt
+
+    Request: {"domain": "Cardiology"}
+    """
+    global pipeline_instance
+
+    domain = (request.get_json() or {}).get("domain", "").strip()
+    if not domain:
+        return jsonify({"error": "Domain is required"}), 400
+    if pipeline_instance is None:
+        return jsonify({"domain": domain, "removed": {}}), 200
+
+    removed = pipeline_instance.invalidate_domain_cache(domain)
+    if invalidation_broadcast is not None:
+        invalidation_broadcast(domain)
+    print(f"🧹 Cache invalidated for {domain}: {removed}")
+    return jsonify({"domain": domain, "removed": removed, "broadcast": invalidation_broadcast is not None}), 200
+
+
 @app.route("/api/domains", methods=["GET"])
 def get_domains():
     """
@@ -503,11 +757,13 @@ def get_domains():
     try:
         from multi_domains_medical_final_rag_model import DOMAINS
         
+        resident = getattr(pipeline_instance, "loaded_domains", None) or ()
         domains_list = [
             {
                 "name": d.name,
                 "dataset": d.dataset_name,
-                "has_index": os.path.exists(d.index_path)
+                "has_index": os.path.exists(d.index_path),
+                "resident": d.name in resident
             }
             for d in DOMAINS
         ]
@@ -525,31 +781,74 @@ def get_domains():
 # SERVER STARTUP
 # ============================================================================
 
+def serving_mode():
+    """(server, threads): "waitress" (default when installed) or "flask", and the waitress thread count"""
+    server = os.getenv("MEDIRAG_SERVER", "waitress")
+    # Enough threads for every slot and queued request, plus headroom so health/auth never wait behind RAG work
+    threads = int(os.getenv("MEDIRAG_THREADS", str(PIPELINE_SLOTS + QUEUE_SIZE + 4)))
+    if server == "waitress":
+        try:
+            import waitress  # noqa: F401
+        except ImportError:
+            # Loud on purpose: the development server has no fixed thread pool and is not meant for production
+            print("\n" + "!" * 80)
+            print("⚠️ WARNING: waitress is not installed; serving with the Flask DEVELOPMENT server instead")
+            print("   Install it with `pip install -r requirements.txt` (or set MEDIRAG_SERVER=flask to")
+            print("   choose the development server explicitly and silence this warning)")
+            print("!" * 80 + "\n", flush=True)
+            server = "flask"
+    return server, threads
+
+
+def serve(server: str, threads: int, host: str = "0.0.0.0", port: int = 5000, sock=None):
+    """Run the app; `sock` is an already-listening socket (pre-fork workers share the master's)"""
+    if server == "waitress":
+        import waitress
+        if sock is not None:
+            waitress.serve(app, sockets=[sock], threads=threads)
+        else:
+            waitress.serve(app, host=host, port=port, threads=threads)
+    elif sock is not None:
+        from werkzeug.serving import make_server
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        # ✅ Disable debug mode to avoid reloader issues
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+
+
 if __name__ == "__main__":
     print("\n" + "="*80)
     print("*** STARTING MEDIRAG BACKEND SERVER ***")
     print("="*80 + "\n")
     
-    # Initialize Medical RAG Pipeline on startup
-    initialize_rag_pipeline()
+    # Initialize Medical RAG Pipeline on startup: "background" serves health/auth at once and
+    # gates RAG endpoints on readiness, "blocking" loads and warms up before accepting connections
+    if os.getenv("MEDIRAG_STARTUP", "background") == "blocking":
+        warm_up_pipeline()
+    else:
+        start_background_init()
     
+    server, threads = serving_mode()
+
     print("\n" + "="*80)
     print("Server Configuration:")
     print("   Host: 0.0.0.0")
     print("   Port: 5000")
-    print("   Debug: True")
+    print(f"   Server: {server}" + (f" ({threads} threads)" if server == "waitress" else ""))
+    print(f"   Pipeline slots: {PIPELINE_SLOTS}, queue: {QUEUE_SIZE}, queue timeout: {QUEUE_TIMEOUT_S:g}s")
     print("="*80 + "\n")
     
     print("Available Endpoints:")
     print("   POST /api/auth/login       - User login")
     print("   POST /api/auth/signup      - User registration")
     print("   POST /api/ask              - Main RAG query endpoint")
+    print("   POST /api/ask/stream       - Streaming RAG query (SSE)")
     print("   POST /api/rag/query        - Legacy RAG endpoint")
     print("   GET  /api/health           - Health check")
     print("   GET  /api/domains          - Get available domains")
+    print("   POST /api/cache/invalidate - Drop cached answers for a domain")
     print("   GET  /api/chat/sessions/<user_id>")
     print("   POST /api/chat/save")
     print("="*80 + "\n")
     
-    # ✅ Disable debug mode to avoid reloader issues
-    app.run(host="0.0.0.0", port=5000, debug=False, use_reloader=False)
+    serve(server, threads)
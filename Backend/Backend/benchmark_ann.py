@@ -0,0 +1,106 @@
+"""
+Recall-vs-latency benchmark for approximate FAISS index variants
+
+Compares each variant against the exact (flat) domain index and reports
+recall@FAISS_TOP_K with p50/p99 single-query search latency.
+
+Usage:
+    python benchmark_ann.py                                    # variants built by build_artifacts.py --ann
+    python benchmark_ann.py --build --nprobe 4 8 16 32 --ef-search 32 64 128
+    python benchmark_ann.py --query-file queries.txt           # real questions, one per line
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import faiss
+from typing import List
+
+from ann_index import ANN_INDEX_TYPES, apply_search_params, build_ann_index
+from multi_domains_medical_final_rag_model import DOMAINS, config
+
+
+def sample_queries(vectors: np.ndarray, n: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """Perturbed stored vectors, re-normalized, as stand-in queries"""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    queries = picks + rng.normal(0, noise, picks.shape).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def encode_queries(path: str) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+    with open(path, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    embedder = SentenceTransformer(config.EMBED_MODEL, device="cpu")
+    return embedder.encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype("float32")
+
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """Single-query searches, as served per request"""
+    latencies, hits = [], 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, I = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(np.intersect1d(I[0][I[0] >= 0], truth[i]))
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark approximate FAISS indexes against exact search")
+    parser.add_argument("--domains", nargs="*", help="Domain names (default: all with an index)")
+    parser.add_argument("--types", nargs="+", default=list(ANN_INDEX_TYPES), choices=ANN_INDEX_TYPES)
+    parser.add_argument("--build", action="store_true", help="Build missing variants in memory")
+    parser.add_argument("--queries", type=int, default=500, help="Sampled queries per domain")
+    parser.add_argument("--query-file", help="Text file of real queries to embed instead of sampling")
+    parser.add_argument("--k", type=int, default=config.FAISS_TOP_K)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[config.FAISS_NPROBE])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[config.FAISS_EF_SEARCH])
+    args = parser.parse_args(argv)
+
+    real_queries = encode_queries(args.query_file) if args.query_file else None
+    print(f"\n{'domain':<28}{'index':<10}{'param':<14}{'recall@' + str(args.k):<12}{'p50 ms':<10}{'p99 ms':<10}")
+    print("-" * 84)
+
+    for domain in DOMAINS:
+        if args.domains and domain.name not in args.domains:
+            continue
+        if not os.path.exists(domain.index_path):
+            continue
+        exact = faiss.read_index(domain.index_path)
+        vectors = exact.reconstruct_n(0, exact.ntotal)
+        queries = real_queries if real_queries is not None else sample_queries(vectors, args.queries)
+        _, truth = exact.search(queries, args.k)
+
+        for kind in args.types:
+            path = domain.ann_index_path(kind)
+            if os.path.exists(path):
+                index = faiss.read_index(path)
+            elif args.build:
+                index = build_ann_index(vectors, kind, exact.metric_type)
+            else:
+                continue
+
+            if faiss.try_extract_index_ivf(index) is not None:
+                sweep = [("nprobe", v, dict(nprobe=v)) for v in args.nprobe]
+            elif isinstance(index, faiss.IndexHNSW):
+                sweep = [("efSearch", v, dict(ef_search=v)) for v in args.ef_search]
+            else:
+                sweep = [("-", "", {})]
+
+            for name, value, params in sweep:
+                apply_search_params(index, **params)
+                r = measure(index, queries, truth, args.k)
+                label = f"{name}={value}" if value != "" else name
+                print(f"{domain.name:<28}{kind:<10}{label:<14}{r['recall']:<12.3f}{r['p50_ms']:<10.3f}{r['p99_ms']:<10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Compiled BM25 index for the Medical RAG pipeline
+Built once offline (see build_artifacts.py) and memory-mapped at load time
+"""
+
+import os
+import json
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from nltk.tokenize import word_tokenize
+
+
+# 3: corpus text is the chunk store's question + answer (ChunkStore.search_text)
+BM25_FORMAT_VERSION = 3
+
+_ARRAY_FILES = ("doc_freqs", "idf", "doc_lens", "indptr", "postings_docs", "postings_tfs")
+
+
+def tokenize(text) -> List[str]:
+    """Tokenizer shared by index build and query time"""
+    return word_tokenize(str(text).lower())
+
+
+class CompiledBM25:
+    """
+    Okapi BM25 over CSR postings (one row of postings per vocabulary term).
+
+    Scores match rank_bm25.BM25Okapi for the same tokenized corpus, so the
+    hybrid fusion weights in RAGConfig keep their meaning.
+
+    On-disk layout (one directory per domain):
+        meta.json           k1, b, epsilon, avgdl, counts, format version
+        vocab.json          term -> term id
+        doc_freqs.npy       int32[V]   documents containing each term
+        idf.npy             float64[V] BM25Okapi idf (epsilon-floored)
+        doc_lens.npy        int32[N]   tokens per document
+        indptr.npy          int64[V+1] postings row offsets per term
+        postings_docs.npy   int32[P]   doc ids, ascending within a term
+        postings_tfs.npy    int32[P]   term frequency in that doc
+    """
+
+    def __init__(self, vocab: Dict[str, int], doc_freqs: np.ndarray, idf: np.ndarray,
+                 doc_lens: np.ndarray, indptr: np.ndarray, postings_docs: np.ndarray,
+                 postings_tfs: np.ndarray, k1: float = 1.5, b: float = 0.75,
+                 epsilon: float = 0.25, avgdl: float = None):
+        self.vocab = vocab
+        self.doc_freqs = doc_freqs
+        self.idf = idf
+        self.doc_lens = doc_lens
+        self.indptr = indptr
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.avgdl = avgdl if avgdl is not None else float(np.mean(doc_lens)) if len(doc_lens) else 0.0
+
+    @property
+    def n_docs(self) -> int:
+        return int(len(self.doc_lens))
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate footprint: array bytes (mapped or in memory) plus the vocab dict"""
+        arrays = (self.doc_freqs, self.idf, self.doc_lens, self.indptr, self.postings_docs, self.postings_tfs)
+        # ~ key string + int + dict slot per term
+        return int(sum(a.nbytes for a in arrays) + len(self.vocab) * 120)
+
+    # --------------------------------------------------------------------
+    # Build
+    # --------------------------------------------------------------------
+    @classmethod
+    def build(cls, tokenized_corpus: Iterable[List[str]], k1: float = 1.5, b: float = 0.75,
+              epsilon: float = 0.25) -> "CompiledBM25":
+        vocab: Dict[str, int] = {}
+        term_ids, doc_ids, tfs, doc_lens = [], [], [], []
+
+        for doc_id, tokens in enumerate(tokenized_corpus):
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        postings_docs = np.asarray(doc_ids, dtype=np.int32)[order]
+        postings_tfs = np.asarray(tfs, dtype=np.int32)[order]
+
+        doc_freqs = np.bincount(term_ids, minlength=len(vocab)).astype(np.int32)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=indptr[1:])
+
+        doc_lens = np.asarray(doc_lens, dtype=np.int32)
+        n_docs = len(doc_lens)
+        avgdl = float(doc_lens.sum()) / n_docs if n_docs else 0.0
+
+        # Same idf as BM25Okapi: negative idfs are floored to epsilon * mean idf
+        idf = np.log(n_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+
+        return cls(vocab, doc_freqs, idf, doc_lens, indptr,
+                   postings_docs, postings_tfs, k1=k1, b=b, epsilon=epsilon, avgdl=avgdl)
+
+    # --------------------------------------------------------------------
+    # Persistence
+    # --------------------------------------------------------------------
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAY_FILES:
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        # meta.json is written last so a half-written directory never loads
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": BM25_FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "epsilon": self.epsilon,
+                "avgdl": self.avgdl,
+                "n_docs": self.n_docs,
+                "n_terms": len(self.vocab),
+                "n_postings": int(len(self.postings_docs)),
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompiledBM25":
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != BM25_FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 format version {meta.get('format_version')} in {path}")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in _ARRAY_FILES}
+        return cls(vocab, k1=meta["k1"], b=meta["b"], epsilon=meta["epsilon"],
+                   avgdl=meta["avgdl"], **arrays)
+
+    # --------------------------------------------------------------------
+    # Scoring
+    # --------------------------------------------------------------------
+    def _term_postings(self, query_tokens: List[str]):
+        """Yield (doc ids, BM25 contribution) for each known query term"""
+        for term, q_count in Counter(query_tokens).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tfs[start:end].astype(np.float64)
+            norm = 1 - self.b + self.b * self.doc_lens[docs] / self.avgdl
+            # Repeated query terms count once per occurrence, as in BM25Okapi
+            yield docs, q_count * self.idf[term_id] * (tf * (self.k1 + 1) / (tf + self.k1 * norm))
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """Dense scores for every document (BM25Okapi.get_scores compatible)"""
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        for docs, contrib in self._term_postings(query_tokens):
+            scores[docs] += contrib
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k (doc ids, scores) touching only the postings of the query terms.
+
+        Cost grows with the postings touched, not with corpus size. Documents
+        that share no term with the query are never returned.
+        """
+        parts = list(self._term_postings(query_tokens))
+        if not parts or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        docs = np.concatenate([d for d, _ in parts])
+        contrib = np.concatenate([c for _, c in parts])
+        doc_ids, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib)
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return doc_ids[top].astype(np.int64), scores[top]
@@ -0,0 +1,156 @@
+"""
+Offline artifact builder for the Medical RAG pipeline
+
+Usage:
+    python build_artifacts.py                      # all domains
+    python build_artifacts.py --domains Cancer Neurology
+    python build_artifacts.py --unified            # also merge all FAISS indexes into one
+    python build_artifacts.py --append Pediatrics  # append a domain to the unified index
+    python build_artifacts.py --ann ivf_flat hnsw  # approximate FAISS variants per domain
+    python build_artifacts.py --router             # domain-routing prototypes (rebuild after adding a domain)
+    python build_artifacts.py --router --router-temperature 0.05  # skip the temperature fit
+"""
+
+import os
+import sys
+import time
+import argparse
+import faiss
+from typing import List
+
+from bm25_index import CompiledBM25, tokenize
+from unified_index import UnifiedIndex
+from ann_index import ANN_INDEX_TYPES, build_ann_index, check_index_loads
+from chunk_store import ChunkStore
+from domain_router import CentroidRouter
+from model_backends import load_embedder
+from multi_domains_medical_final_rag_model import (
+    DOMAIN_ROUTER_PATH, DOMAINS, DomainConfig, UNIFIED_INDEX_PATH, config, device, load_id2doc
+)
+
+
+def build_chunks(domain: DomainConfig) -> ChunkStore:
+    start = time.time()
+    n_chunks = ChunkStore.write(domain.chunks_path, load_id2doc(domain.id2doc_path), domain=domain.name)
+    print(f"  ✅ Chunks {domain.name}: {n_chunks} chunks ({round(time.time() - start, 2)}s)")
+    return ChunkStore.open(domain.chunks_path)
+
+
+def build_bm25(domain: DomainConfig, chunks: ChunkStore) -> CompiledBM25:
+    start = time.time()
+    bm25 = CompiledBM25.build(tokenize(chunks.search_text(i)) for i in range(len(chunks)))
+    bm25.save(domain.bm25_path)
+    print(f"  ✅ BM25 {domain.name}: {bm25.n_docs} docs, {len(bm25.vocab)} terms, "
+          f"{len(bm25.postings_docs)} postings ({round(time.time() - start, 2)}s)")
+    return bm25
+
+
+def read_vectors(domain: DomainConfig):
+    index = faiss.read_index(domain.index_path)
+    return index.reconstruct_n(0, index.ntotal), index.metric_type
+
+
+def build_ann(domain: DomainConfig, kind: str, nlist: int = None, pq_m: int = 48, hnsw_m: int = 32):
+    start = time.time()
+    vectors, metric = read_vectors(domain)
+    index = build_ann_index(vectors, kind, metric, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+    faiss.write_index(index, domain.ann_index_path(kind))
+    # Fail here rather than at serving time if this faiss build cannot memory-map the variant
+    check_index_loads(domain.ann_index_path(kind), index)
+    print(f"  ✅ {kind} {domain.name}: {index.ntotal} vectors ({round(time.time() - start, 2)}s)")
+    return index
+
+
+def build_unified(domains: List[DomainConfig]) -> UnifiedIndex:
+    unified = None
+    for domain in domains:
+        vectors, metric = read_vectors(domain)
+        if unified is None:
+            unified = UnifiedIndex.empty(vectors.shape[1], metric)
+        unified.append_domain(domain.name, vectors)
+        print(f"  ✅ Unified index += {domain.name} ({len(vectors)} vectors)")
+    unified.save(UNIFIED_INDEX_PATH)
+    return unified
+
+
+def append_to_unified(domain: DomainConfig) -> UnifiedIndex:
+    unified = UnifiedIndex.load(UNIFIED_INDEX_PATH)
+    vectors, _ = read_vectors(domain)
+    unified.append_domain(domain.name, vectors)
+    unified.save(UNIFIED_INDEX_PATH)
+    print(f"  ✅ Appended {domain.name} ({len(vectors)} vectors, total {unified.index.ntotal})")
+    return unified
+
+
+def build_router(domains: List[DomainConfig], prototypes: int = 8, temperature: float = None) -> CentroidRouter:
+    start = time.time()
+    # Calibrate on real questions (the chunk store's question column), embedded exactly like queries
+    questions = {d.name: ChunkStore.open(d.chunks_path).question for d in domains if ChunkStore.exists(d.chunks_path)}
+    embedder = load_embedder(config.EMBED_MODEL, config.MODEL_BACKEND, device)
+
+    def encode(texts: List[str]):
+        return embedder.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True,
+                               show_progress_bar=False)
+
+    router = CentroidRouter.build({d.name: read_vectors(d)[0] for d in domains}, questions, encode,
+                                  prototypes=prototypes, embed_model=config.EMBED_MODEL, temperature=temperature)
+    router.save(DOMAIN_ROUTER_PATH)
+    meta = router.meta
+    without_questions = [name for name, source in meta["calibration_source"].items() if source != "questions"]
+    if without_questions:
+        print(f"  ⚠️ No question text for {without_questions}; calibrated on their chunk vectors instead")
+    print(f"  ✅ Router: {len(router.names)} domains, {meta['prototypes']} prototypes, "
+          f"temperature {meta['temperature']:.4f}, held-out top-1 {meta.get('calibration_top1', 0):.3f} "
+          f"({round(time.time() - start, 2)}s)")
+    return router
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Build compiled retrieval artifacts per domain")
+    parser.add_argument("--domains", nargs="*", help="Domain names to build (default: all)")
+    parser.add_argument("--unified", action="store_true", help="Merge the selected FAISS indexes into one")
+    parser.add_argument("--append", metavar="DOMAIN", help="Append one domain to the existing unified index")
+    parser.add_argument("--ann", nargs="+", default=[], choices=[k for k in ANN_INDEX_TYPES if k != "flat"],
+                        help="Approximate FAISS index variants to build per domain")
+    parser.add_argument("--nlist", type=int, help="IVF list count (default: ~4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=48, help="IVF-PQ sub-quantizers (must divide dim)")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+    parser.add_argument("--router", action="store_true",
+                        help="Build the domain router from the selected domains' FAISS vectors")
+    parser.add_argument("--router-prototypes", type=int, default=8, help="k-means prototypes per domain")
+    parser.add_argument("--router-temperature", type=float,
+                        help="Use this softmax temperature instead of fitting it on held-out questions")
+    args = parser.parse_args(argv)
+
+    if args.append:
+        domain = next((d for d in DOMAINS if d.name == args.append), None)
+        if domain is None:
+            parser.error(f"Unknown domain: {args.append}")
+        build_bm25(domain, build_chunks(domain))
+        append_to_unified(domain)
+        return
+
+    selected = [d for d in DOMAINS if not args.domains or d.name in args.domains]
+    print(f"\n🔨 Building artifacts for {len(selected)} domain(s)...")
+    for domain in selected:
+        if not os.path.exists(domain.id2doc_path):
+            print(f"  ⚠️ Skipping {domain.name}: {domain.id2doc_path} not found")
+            continue
+        build_bm25(domain, build_chunks(domain))
+        if os.path.exists(domain.index_path):
+            check_index_loads(domain.index_path)
+            for kind in args.ann:
+                build_ann(domain, kind, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+    if args.unified:
+        build_unified([d for d in selected if os.path.exists(d.index_path)])
+    if args.router:
+        try:
+            build_router([d for d in selected if os.path.exists(d.index_path)], args.router_prototypes,
+                         args.router_temperature)
+        except ValueError as e:
+            sys.exit(f"❌ Router not built: {e}")
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    main()
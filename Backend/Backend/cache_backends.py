@@ -0,0 +1,399 @@
+"""
+Pluggable cache backends for the Medical RAG pipeline
+Byte-valued key/value stores (in-process LRU, SQLite file, Redis protocol) shared by embeddings, retrieval and answers
+"""
+
+import json
+import time
+import socket
+import struct
+import sqlite3
+import hashlib
+import fnmatch
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+
+CACHE_BACKENDS = ("memory", "sqlite", "redis")
+
+
+# ========================================================================
+# SERIALIZATION
+# ========================================================================
+# b"N" + dtype (length-prefixed) + ndim + int64 shape + raw C-order bytes  -> numpy array
+# b"J" + UTF-8 JSON                                                        -> everything else
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def pack(value) -> bytes:
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        dtype = array.dtype.str.encode("ascii")
+        return b"".join([b"N", struct.pack("<B", len(dtype)), dtype, struct.pack("<B", array.ndim),
+                         struct.pack(f"<{array.ndim}q", *array.shape), array.tobytes()])
+    return b"J" + json.dumps(value, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def unpack(data: bytes):
+    """Arrays come back read-only, backed by `data`"""
+    kind, body = data[:1], memoryview(data)[1:]
+    if kind == b"J":
+        return json.loads(bytes(body).decode("utf-8"))
+    if kind != b"N":
+        raise ValueError(f"Unknown cache value tag {kind!r}")
+    dtype_len = body[0]
+    dtype = np.dtype(bytes(body[1:1 + dtype_len]).decode("ascii"))
+    pos = 1 + dtype_len
+    ndim = body[pos]
+    shape = struct.unpack_from(f"<{ndim}q", body, pos + 1)
+    return np.frombuffer(body, dtype=dtype, offset=pos + 1 + 8 * ndim).reshape(shape)
+
+
+def digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# ========================================================================
+# BACKENDS
+# ========================================================================
+
+class CacheBackend:
+    """
+    Byte-valued key/value store. Keys are strings; ``delete_matching`` takes
+    a glob pattern (``*``, ``?``, ``[...]``). ``ttl_s=None`` means no expiry.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_s: float = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_matching(self, pattern: str) -> int:
+        raise NotImplementedError
+
+    def get_value(self, key: str):
+        """get() + unpack(); backend errors count as misses so a cache outage never fails a request"""
+        try:
+            data = self.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"  ⚠️ {self.name} cache get failed: {e}")
+            data = None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return unpack(data)
+
+    def set_value(self, key: str, value, ttl_s: float = None):
+        try:
+            self.set(key, pack(value), ttl_s)
+        except Exception as e:
+            self.errors += 1
+            print(f"  ⚠️ {self.name} cache set failed: {e}")
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {"backend": self.name, "hits": self.hits, "misses": self.misses, "errors": self.errors,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU bounded by entry count and total value bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl_s: float = None):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, time.time() + ttl_s if ttl_s else None)
+            self._bytes += len(value)
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key: str):
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def delete_matching(self, pattern: str) -> int:
+        with self._lock:
+            stale = [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+            for key in stale:
+                self._pop(key)
+            return len(stale)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(super().stats(), entries=len(self._data), bytes=self._bytes)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Local disk cache in one SQLite file (WAL mode), shared by every worker
+    process on the host. Least recently read rows are evicted beyond
+    ``max_entries``.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                         "expires REAL, accessed REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] is not None and row[1] < now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return bytes(row[0])
+
+    def set(self, key: str, value: bytes, ttl_s: float = None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                     (key, sqlite3.Binary(value), now + ttl_s if ttl_s else None, now))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (now,))
+        overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                         (overflow,))
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_matching(self, pattern: str) -> int:
+        return self._conn().execute("DELETE FROM cache WHERE key GLOB ?", (pattern,)).rowcount
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict:
+        entries = self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return dict(super().stats(), entries=entries, path=self.path)
+
+
+class RedisError(RuntimeError):
+    """Error reply from a Redis-protocol server"""
+
+
+class RESPConnection:
+    """Minimal RESP2 client connection (no redis-py dependency)"""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: str = None, timeout: float = 2.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.command("AUTH", password)
+        if db:
+            self.command("SELECT", db)
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode("utf-8")
+            elif not isinstance(arg, (bytes, bytearray)):
+                arg = str(arg).encode("ascii")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [self.read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def command(self, *args):
+        self.sock.sendall(self.encode(*args))
+        return self.read_reply()
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache on any Redis-protocol server (Redis, Valkey, KeyDB, or the local
+    stand-in in resp_standin.py). All keys live under ``namespace``. One
+    connection per thread, reconnected once on failure.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", namespace: str = "medirag:"):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.namespace = namespace
+        self._local = threading.local()
+
+    def _connection(self) -> RESPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = RESPConnection(self.host, self.port, self.db, self.password)
+            self._local.conn = conn
+        return conn
+
+    def _command(self, *args):
+        try:
+            return self._connection().command(*args)
+        except (ConnectionError, OSError):
+            self.close()
+            return self._connection().command(*args)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._command("GET", self.namespace + key)
+
+    def set(self, key: str, value: bytes, ttl_s: float = None):
+        if ttl_s:
+            self._command("SET", self.namespace + key, value, "PX", int(ttl_s * 1000))
+        else:
+            self._command("SET", self.namespace + key, value)
+
+    def delete(self, key: str):
+        self._command("DEL", self.namespace + key)
+
+    def _scan(self, pattern: str) -> Iterator[bytes]:
+        cursor = b"0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", self.namespace + pattern, "COUNT", 1000)
+            yield from keys
+            if cursor in (b"0", 0, "0"):
+                return
+
+    def delete_matching(self, pattern: str) -> int:
+        keys = list(self._scan(pattern))
+        removed = 0
+        for start in range(0, len(keys), 500):
+            removed += self._command("DEL", *keys[start:start + 500])
+        return removed
+
+    def ping(self) -> bool:
+        return self._command("PING") == "PONG"
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_cache_backend(kind: str, sqlite_path: str = None, redis_url: str = None,
+                       max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024) -> CacheBackend:
+    if kind == "memory":
+        return MemoryCache(max_entries=max_entries, max_bytes=max_bytes)
+    if kind == "sqlite":
+        return SQLiteCache(sqlite_path, max_entries=max_entries)
+    if kind == "redis":
+        return RedisCache(redis_url)
+    raise ValueError(f"Unknown cache backend '{kind}', expected one of {CACHE_BACKENDS}")
+
+
+def domain_tag(domains: List[str]) -> str:
+    """Key segment naming the routed domains, so delete_matching("*|<domain>|*") invalidates them"""
+    return "|" + "|".join(domains) + "|"
@@ -0,0 +1,185 @@
+"""
+Parity and speed check for quantized / ONNX model backends
+
+Runs the same queries end to end (embed, retrieve, rerank, generate) with the
+fp32 models and with the selected backend, then reports embedding cosine,
+retrieval and rerank agreement, answer agreement, per-stage latency and the
+RSS added by loading each backend's models. Exits non-zero when top-1 rerank
+agreement falls below --min-top1.
+
+Usage:
+    python check_backend_parity.py --backend int8
+    python check_backend_parity.py --backend onnx --query-file queries.txt --profile fast
+"""
+
+import gc
+import sys
+import time
+import argparse
+import numpy as np
+from typing import Dict, List
+
+from model_backends import MODEL_BACKENDS, load_cross_encoder, load_embedder, load_generator
+from reranking import RerankEngine
+from multi_domains_medical_final_rag_model import (
+    DOMAINS, MODEL_EXPORT_DIR, MemoryEfficientRAGPipeline, config, device
+)
+
+
+DEFAULT_QUERIES = [
+    "What are the early symptoms of breast cancer?",
+    "How is high blood pressure treated?",
+    "What causes eczema flare-ups?",
+    "What are the warning signs of kidney disease?",
+    "How is epilepsy diagnosed?",
+    "What lifestyle changes help manage type 2 diabetes?",
+    "What are the side effects of chemotherapy?",
+    "What is atrial fibrillation?",
+]
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), falling back to peak RSS elsewhere"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_models(backend: str) -> Dict:
+    before = rss_mb()
+    reranker = load_cross_encoder(config.RERANK_MODEL, backend, device)
+    tokenizer, generator = load_generator(config.GENERATOR_MODEL, backend, device, MODEL_EXPORT_DIR)
+    models = {
+        "embedder": load_embedder(config.EMBED_MODEL, backend, device),
+        "reranker": reranker,
+        "rerank_engine": RerankEngine(reranker, token_budget=config.RERANK_TOKEN_BUDGET,
+                                      cache_size=config.RERANK_TOKEN_CACHE_SIZE)
+                         if config.RERANK_DYNAMIC_BATCHING else None,
+        "generator_tokenizer": tokenizer,
+        "generator_model": generator,
+    }
+    gc.collect()
+    models["rss_mb"] = rss_mb() - before
+    return models
+
+
+def run(pipeline: MemoryEfficientRAGPipeline, models: Dict, queries: List[str], profile: str) -> List[Dict]:
+    for name, value in models.items():
+        if name != "rss_mb":
+            setattr(pipeline, name, value)
+    results = []
+    for query in queries:
+        timings = {}
+        start = time.perf_counter()
+        query_emb = pipeline.encode_query(query)
+        timings["embed"] = time.perf_counter() - start
+
+        domains = pipeline.route_to_domains(query, query_emb=query_emb)
+        candidates = pipeline.hybrid_retrieval(query, domains, query_emb=query_emb)
+        start = time.perf_counter()
+        reranked = pipeline.rerank_results(query, candidates, query_emb=query_emb)
+        timings["rerank"] = time.perf_counter() - start
+
+        confidence = float(np.mean([r["rerank_score"] for r in reranked])) if reranked else 0.5
+        start = time.perf_counter()
+        answer = pipeline.generate_answer(query, reranked, False, confidence, profile=profile)
+        timings["generate"] = time.perf_counter() - start
+
+        results.append({
+            "embedding": query_emb[0],
+            "retrieved": {(c["domain"], c["chunk_id"]) for c in candidates},
+            "ranking": [(r["domain"], r["chunk_id"]) for r in reranked],
+            "answer": answer,
+            "timings": timings,
+        })
+    return results
+
+
+def token_f1(a: str, b: str) -> float:
+    a_tokens, b_tokens = a.lower().split(), b.lower().split()
+    common = sum(min(a_tokens.count(t), b_tokens.count(t)) for t in set(a_tokens))
+    if not common:
+        return 0.0
+    precision, recall = common / len(a_tokens), common / len(b_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def compare(base: List[Dict], other: List[Dict]) -> Dict:
+    def overlap(a, b):
+        return len(set(a) & set(b)) / max(len(set(a) | set(b)), 1)
+
+    return {
+        "embedding_cosine": float(np.mean([np.dot(b["embedding"], o["embedding"]) for b, o in zip(base, other)])),
+        "retrieval_overlap": float(np.mean([overlap(b["retrieved"], o["retrieved"]) for b, o in zip(base, other)])),
+        "top1_agreement": float(np.mean([bool(b["ranking"]) and b["ranking"][:1] == o["ranking"][:1]
+                                         for b, o in zip(base, other)])),
+        "topk_overlap": float(np.mean([overlap(b["ranking"], o["ranking"]) for b, o in zip(base, other)])),
+        "answer_exact": float(np.mean([b["answer"] == o["answer"] for b, o in zip(base, other)])),
+        "answer_f1": float(np.mean([token_f1(b["answer"], o["answer"]) for b, o in zip(base, other)])),
+    }
+
+
+def p50_ms(results: List[Dict], stage: str) -> float:
+    return float(np.percentile([r["timings"][stage] for r in results], 50) * 1000)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare a quantized/ONNX model backend against fp32")
+    parser.add_argument("--backend", default="int8", choices=[b for b in MODEL_BACKENDS if b != "torch"])
+    parser.add_argument("--query-file", help="Text file of queries, one per line")
+    parser.add_argument("--profile", default=None, help="Generation profile (default: config.GENERATION_PROFILE)")
+    parser.add_argument("--min-top1", type=float, default=0.8, help="Fail below this top-1 rerank agreement")
+    args = parser.parse_args(argv)
+
+    if args.query_file:
+        with open(args.query_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+
+    config.MODEL_BACKEND = "torch"
+    config.MICRO_BATCHING = False
+    # Both backends must compute everything themselves
+    config.QUERY_EMBEDDING_CACHE_SIZE = 0
+    config.GENERATION_CACHE = False
+    config.ANSWER_CACHE = False
+    config.CACHE_BACKEND = None
+    pipeline = MemoryEfficientRAGPipeline(config, DOMAINS)
+    try:
+        base_models = load_models("torch")
+        other_models = load_models(args.backend)
+        # Warm both once so lazy initialization is not timed
+        run(pipeline, base_models, queries[:1], args.profile)
+        run(pipeline, other_models, queries[:1], args.profile)
+        base = run(pipeline, base_models, queries, args.profile)
+        other = run(pipeline, other_models, queries, args.profile)
+    finally:
+        pipeline.close()
+
+    report = compare(base, other)
+    print(f"\nParity: fp32 vs {args.backend} ({len(queries)} queries)")
+    print("-" * 60)
+    for key, value in report.items():
+        print(f"{key:<22}{value:.3f}")
+    print(f"\n{'stage':<12}{'fp32 p50 ms':<14}{args.backend + ' p50 ms':<14}{'speedup':<10}")
+    print("-" * 50)
+    for stage in ("embed", "rerank", "generate"):
+        b, o = p50_ms(base, stage), p50_ms(other, stage)
+        print(f"{stage:<12}{b:<14.1f}{o:<14.1f}{b / o if o else 0:<10.2f}")
+    print(f"\nModel RSS: fp32 +{base_models['rss_mb']:.0f} MB, {args.backend} +{other_models['rss_mb']:.0f} MB")
+
+    if report["top1_agreement"] < args.min_top1:
+        print(f"\n❌ top-1 agreement {report['top1_agreement']:.3f} < {args.min_top1}")
+        return 1
+    print("\n✅ Parity check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
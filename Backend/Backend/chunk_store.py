@@ -0,0 +1,164 @@
+"""
+Columnar, memory-mappable chunk store for the Medical RAG pipeline
+Fixed fields (question, answer, domain, source id) with lazy per-row access by integer id
+"""
+
+import os
+import json
+import numpy as np
+from typing import Dict, Iterable, Iterator, Tuple
+
+
+CHUNK_STORE_FORMAT_VERSION = 1
+
+_TEXT_FIELDS = ("question", "answer")
+
+
+def split_chunk(doc, row: int) -> Tuple[str, str, int]:
+    """Normalize one pickled chunk (str or dict) to (question, answer, source id)"""
+    if isinstance(doc, dict):
+        question = str(doc.get("question") or "")
+        answer = str(doc.get("answer") or doc.get("text") or doc.get("content") or doc.get("response") or "")
+        source_id = doc.get("source_id", doc.get("id", row))
+        if not question and not answer:
+            answer = str(doc)
+        try:
+            return question, answer, int(source_id)
+        except (TypeError, ValueError):
+            return question, answer, row
+    return "", str(doc), row
+
+
+class _TextColumn:
+    """UTF-8 blob plus int64[N+1] offsets; rows decode lazily"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values) -> "_TextColumn":
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def open(cls, prefix: str, mmap: bool) -> "_TextColumn":
+        offsets = np.load(f"{prefix}.offsets.npy", mmap_mode="r" if mmap else None)
+        if os.path.getsize(f"{prefix}.bin") == 0:
+            blob = np.empty(0, dtype=np.uint8)
+        elif mmap:
+            blob = np.memmap(f"{prefix}.bin", dtype=np.uint8, mode="r")
+        else:
+            blob = np.fromfile(f"{prefix}.bin", dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __getitem__(self, idx: int) -> str:
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+class ChunkStore:
+    """
+    Read-only chunk table addressed by integer id (the FAISS / BM25 row id).
+
+    ``store[i]`` is the chunk's display text (answer, else question), which is
+    what reranking and generation consume; ``store.row(i)`` returns every field.
+
+    On-disk layout:
+        <path>.meta.json             domain, row count, format version
+        <path>.question.bin          UTF-8 questions, concatenated
+        <path>.question.offsets.npy  int64[N+1] byte offsets
+        <path>.answer.bin            UTF-8 answers, concatenated
+        <path>.answer.offsets.npy    int64[N+1] byte offsets
+        <path>.source_ids.npy        int64[N] id of the chunk in its source dataset
+    """
+
+    def __init__(self, domain: str, question: _TextColumn, answer: _TextColumn, source_ids: np.ndarray):
+        self.domain = domain
+        self.question = question
+        self.answer = answer
+        self.source_ids = source_ids
+
+    # --------------------------------------------------------------------
+    # Conversion / Persistence
+    # --------------------------------------------------------------------
+    @classmethod
+    def from_docs(cls, docs: Iterable, domain: str = "") -> "ChunkStore":
+        rows = [split_chunk(doc, i) for i, doc in enumerate(docs)]
+        return cls(domain,
+                   _TextColumn.from_strings(r[0] for r in rows),
+                   _TextColumn.from_strings(r[1] for r in rows),
+                   np.asarray([r[2] for r in rows], dtype=np.int64))
+
+    @staticmethod
+    def write(path: str, docs: Iterable, domain: str = "") -> int:
+        """Stream chunks to disk column by column without holding the blobs in memory"""
+        offsets = {field: [0] for field in _TEXT_FIELDS}
+        source_ids = []
+        files = {field: open(f"{path}.{field}.bin", "wb") for field in _TEXT_FIELDS}
+        try:
+            for row, doc in enumerate(docs):
+                question, answer, source_id = split_chunk(doc, row)
+                for field, value in zip(_TEXT_FIELDS, (question, answer)):
+                    offsets[field].append(offsets[field][-1] + files[field].write(value.encode("utf-8")))
+                source_ids.append(source_id)
+        finally:
+            for f in files.values():
+                f.close()
+        for field in _TEXT_FIELDS:
+            np.save(f"{path}.{field}.offsets.npy", np.asarray(offsets[field], dtype=np.int64))
+        np.save(f"{path}.source_ids.npy", np.asarray(source_ids, dtype=np.int64))
+        # meta.json is written last so a half-written store never opens
+        with open(f"{path}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({"format_version": CHUNK_STORE_FORMAT_VERSION, "domain": domain,
+                       "n_rows": len(source_ids), "fields": ["question", "answer", "domain", "source_id"]},
+                      f, indent=2)
+        return len(source_ids)
+
+    @classmethod
+    def open(cls, path: str, mmap: bool = True) -> "ChunkStore":
+        with open(f"{path}.meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != CHUNK_STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store format version {meta.get('format_version')} in {path}")
+        return cls(meta["domain"],
+                   _TextColumn.open(f"{path}.question", mmap),
+                   _TextColumn.open(f"{path}.answer", mmap),
+                   np.load(f"{path}.source_ids.npy", mmap_mode="r" if mmap else None))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(f"{path}.meta.json")
+
+    # --------------------------------------------------------------------
+    # Row access
+    # --------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.source_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the text blobs, offsets and source ids (mapped or in memory)"""
+        columns = (self.question, self.answer)
+        return int(sum(c.blob.nbytes + c.offsets.nbytes for c in columns) + self.source_ids.nbytes)
+
+    def __getitem__(self, idx: int) -> str:
+        return self.answer[idx] or self.question[idx]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def search_text(self, idx: int) -> str:
+        """Question and answer together, as indexed by BM25"""
+        return f"{self.question[idx]} {self.answer[idx]}".strip()
+
+    def row(self, idx: int) -> Dict:
+        return {
+            "question": self.question[idx],
+            "answer": self.answer[idx],
+            "domain": self.domain,
+            "source_id": int(self.source_ids[idx]),
+        }
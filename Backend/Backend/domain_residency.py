@@ -0,0 +1,235 @@
+"""
+Domain residency for the Medical RAG pipeline
+Loads domain indexes (FAISS, BM25, chunk store) on demand within a memory budget, evicting the least recently used
+"""
+
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+MB = 1024 * 1024
+
+
+class DomainResidencyManager:
+    """
+    Mapping-like view of the resident domains (``name in manager``,
+    ``manager.get(name)``, iteration over resident names), plus:
+
+        acquire(names, wait_s)  resident data for the names; cold domains are
+                                loaded on a background pool and waited for at
+                                most ``wait_s`` (a late load still completes
+                                and serves later requests)
+        preload(names)          blocking load, e.g. pinned domains at startup
+        evict / pin / unpin
+
+    ``loader(name)`` returns ``(data, nbytes)``. After every load the least
+    recently used unpinned domains are evicted until the resident total fits
+    ``budget_mb`` (None = unlimited). Evicted data stays valid for requests
+    already holding it and is freed when they finish. A failed load is not
+    retried for ``retry_s`` seconds, doubling per consecutive failure up to
+    ``max_retry_s``; requests meanwhile get the stored error immediately.
+    Loads, evictions and failures are kept in ``events`` and summarized by
+    ``report()``.
+    """
+
+    def __init__(self, loader: Callable[[str], Tuple[Dict, int]], budget_mb: Optional[float] = None,
+                 pinned: Iterable[str] = (), load_workers: int = 2, max_events: int = 200,
+                 retry_s: float = 30.0, max_retry_s: float = 600.0):
+        self._loader = loader
+        self.budget_bytes = int(budget_mb * MB) if budget_mb else None
+        self.pinned = set(pinned)
+        self.load_workers = load_workers
+        self.retry_s = retry_s
+        self.max_retry_s = max_retry_s
+        self._resident: "OrderedDict[str, Dict]" = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        self._last_bytes: Dict[str, int] = {}  # size at the last load, used to make room before reloading
+        self._failures: Dict[str, Dict] = {}  # name -> {"error", "count", "retry_at"} until the next success
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=load_workers, thread_name_prefix="domain-load")
+        self.events = deque(maxlen=max_events)
+        self.counters = {"hits": 0, "misses": 0, "loads": 0, "load_failures": 0, "failed_skips": 0,
+                         "evictions": 0, "load_seconds": 0.0}
+
+    # --------------------------------------------------------------------
+    # Mapping view
+    # --------------------------------------------------------------------
+    def __contains__(self, name: str) -> bool:
+        return name in self._resident
+
+    def __iter__(self):
+        return iter(list(self._resident))
+
+    def __len__(self) -> int:
+        return len(self._resident)
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Resident data (marked as recently used), or None without triggering a load"""
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                return None
+            self._resident.move_to_end(name)
+            entry["hits"] += 1
+            return entry["data"]
+
+    def __getitem__(self, name: str) -> Dict:
+        data = self.get(name)
+        if data is None:
+            raise KeyError(name)
+        return data
+
+    # --------------------------------------------------------------------
+    # Loading
+    # --------------------------------------------------------------------
+    def load(self, name: str) -> Future:
+        """Future for the domain's data; concurrent requests for one cold domain share a single load"""
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is not None:
+                future = Future()
+                future.set_result(entry["data"])
+                return future
+            future = self._loading.get(name)
+            failure = self._failures.get(name)
+            if future is None and failure is not None and time.monotonic() < failure["retry_at"]:
+                self.counters["failed_skips"] += 1
+                future = Future()
+                future.set_exception(failure["error"])
+                return future
+            if future is None:
+                if name in self._last_bytes:
+                    self._evict_over_budget(incoming=self._last_bytes[name])
+                future = self._executor.submit(self._load, name)
+                self._loading[name] = future
+            return future
+
+    def _load(self, name: str) -> Dict:
+        start = time.perf_counter()
+        try:
+            data, nbytes = self._loader(name)
+        except Exception as e:
+            with self._lock:
+                self._loading.pop(name, None)
+                self.counters["load_failures"] += 1
+                count = self._failures.get(name, {}).get("count", 0) + 1
+                backoff = min(self.retry_s * 2 ** (count - 1), self.max_retry_s)
+                self._failures[name] = {"error": e, "count": count, "retry_at": time.monotonic() + backoff}
+                self._event("load_failed", name, error=f"{type(e).__name__}: {e}", retry_in_s=round(backoff, 1))
+            print(f"  ❌ Failed to load {name}: {e} (retrying in {backoff:.0f}s)")
+            raise
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self._resident[name] = {"data": data, "bytes": nbytes, "loaded_at": time.time(), "hits": 0}
+            self._last_bytes[name] = nbytes
+            self._failures.pop(name, None)
+            self._loading.pop(name, None)
+            self.counters["loads"] += 1
+            self.counters["load_seconds"] += seconds
+            self._event("load", name, mb=round(nbytes / MB, 1), seconds=round(seconds, 3))
+            self._evict_over_budget(protect=name)
+        print(f"  📂 Loaded {name} ({nbytes / MB:.0f} MB, {seconds:.2f}s); "
+              f"resident {self._resident_bytes() / MB:.0f} MB")
+        return data
+
+    def acquire(self, names: List[str], wait_s: float) -> Tuple[Dict[str, Dict], List[str]]:
+        """({name: data} for the names available within wait_s, [names still cold or failed])"""
+        resident, pending = {}, {}
+        for name in names:
+            data = self.get(name)
+            if data is not None:
+                resident[name] = data
+            else:
+                pending[name] = self.load(name)
+        with self._lock:
+            self.counters["hits"] += len(resident)
+            self.counters["misses"] += len(pending)
+        if pending:
+            done, _ = wait(list(pending.values()), timeout=wait_s)
+            for name, future in pending.items():
+                if future in done and future.exception() is None:
+                    resident[name] = future.result()
+        return resident, [n for n in names if n not in resident]
+
+    def preload(self, names: Iterable[str]) -> List[str]:
+        """Load the domains and wait for all of them; returns the names that loaded"""
+        futures = {name: self.load(name) for name in names}
+        wait(list(futures.values()))
+        return [name for name, future in futures.items() if future.exception() is None]
+
+    # --------------------------------------------------------------------
+    # Eviction (callers hold the lock)
+    # --------------------------------------------------------------------
+    def _resident_bytes(self) -> int:
+        return sum(e["bytes"] for e in self._resident.values())
+
+    def _evict_over_budget(self, protect: str = None, incoming: int = 0):
+        if self.budget_bytes is None:
+            return
+        total = self._resident_bytes() + incoming
+        for name in list(self._resident):
+            if total <= self.budget_bytes:
+                return
+            if name in self.pinned or name == protect:
+                continue
+            total -= self._pop(name, "budget")
+        if total > self.budget_bytes and not incoming:
+            self._event("over_budget", protect, mb=round(total / MB, 1))
+            print(f"  ⚠️ Domain residency over budget ({total / MB:.0f} MB > {self.budget_bytes / MB:.0f} MB); "
+                  f"only pinned or in-use domains remain")
+
+    def _pop(self, name: str, reason: str) -> int:
+        entry = self._resident.pop(name)
+        self.counters["evictions"] += 1
+        self._event("evict", name, mb=round(entry["bytes"] / MB, 1), reason=reason)
+        print(f"  🗑️ Evicted {name} ({entry['bytes'] / MB:.0f} MB, {reason})")
+        return entry["bytes"]
+
+    def evict(self, name: str, reason: str = "manual") -> bool:
+        with self._lock:
+            if name not in self._resident:
+                return False
+            self._pop(name, reason)
+            return True
+
+    def pin(self, name: str):
+        self.pinned.add(name)
+
+    def unpin(self, name: str):
+        self.pinned.discard(name)
+        with self._lock:
+            self._evict_over_budget()
+
+    # --------------------------------------------------------------------
+    # Lifecycle / Reporting
+    # --------------------------------------------------------------------
+    def _event(self, event: str, name: str, **fields):
+        self.events.append(dict(time=round(time.time(), 3), event=event, domain=name, **fields))
+
+    def after_fork(self):
+        """The loader pool's threads do not survive fork; in-flight loads belong to the parent"""
+        self._executor = ThreadPoolExecutor(max_workers=self.load_workers, thread_name_prefix="domain-load")
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def report(self, recent_events: int = 20) -> Dict:
+        with self._lock:
+            return {
+                "budget_mb": round(self.budget_bytes / MB, 1) if self.budget_bytes else None,
+                "resident_mb": round(self._resident_bytes() / MB, 1),
+                "resident": [{"domain": name, "mb": round(e["bytes"] / MB, 1), "pinned": name in self.pinned,
+                              "hits": e["hits"], "loaded_at": round(e["loaded_at"], 3)}
+                             for name, e in reversed(self._resident.items())],  # most recently used first
+                "loading": list(self._loading),
+                "failed": {name: {"error": f"{type(f['error']).__name__}: {f['error']}", "failures": f["count"],
+                                  "retry_in_s": round(max(0.0, f["retry_at"] - time.monotonic()), 1)}
+                           for name, f in self._failures.items()},
+                "counters": dict(self.counters, load_seconds=round(self.counters["load_seconds"], 3)),
+                "events": list(self.events)[-recent_events:],
+            }
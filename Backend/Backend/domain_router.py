@@ -0,0 +1,178 @@
+"""
+Embedding-based domain routing for the Medical RAG pipeline
+Per-domain prototype vectors built offline from the FAISS vectors; a query is routed with one matrix-vector product
+"""
+
+import json
+import numpy as np
+import faiss
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+# Candidate softmax temperatures; prototype/query cosine gaps between domains are typically 0.02-0.2
+TEMPERATURE_GRID = np.geomspace(0.02, 1.0, 50)
+
+
+class CentroidRouter:
+    """
+    ``prototypes`` is a float32 ``[P, dim]`` matrix of L2-normalized
+    prototype vectors (spherical k-means centroids of each domain's chunk
+    vectors), grouped so each domain owns one contiguous block of rows
+    starting at ``starts[i]``.
+
+    Scoring a query is ``prototypes @ q`` followed by a per-domain max
+    (``np.maximum.reduceat``); probabilities are ``softmax(scores / T)``.
+    The temperature ``T`` is fitted at build time on the embedded questions
+    of held-out chunks (excluded from the k-means), labelled with their own
+    domain, so the probabilities are calibrated for "which index holds the
+    answer" on question-like input.
+
+    On-disk layout (one ``.npz``):
+        prototypes   float32[P, dim]
+        starts       int64[D]  first prototype row of each domain
+        names        JSON list of domain names
+        meta         JSON: temperature, embed model, calibration stats
+    """
+
+    def __init__(self, prototypes: np.ndarray, starts: np.ndarray, names: List[str], meta: Dict):
+        self.prototypes = np.ascontiguousarray(prototypes, dtype=np.float32)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.names = list(names)
+        self.meta = meta
+        self.temperature = float(meta["temperature"])
+
+    @property
+    def dim(self) -> int:
+        return int(self.prototypes.shape[1])
+
+    # --------------------------------------------------------------------
+    # Build / Persistence
+    # --------------------------------------------------------------------
+    @staticmethod
+    def _prototypes(vectors: np.ndarray, k: int, seed: int) -> np.ndarray:
+        # faiss wants ~40 points per centroid; small domains get fewer prototypes (or just the mean)
+        k = max(1, min(k, len(vectors) // 40))
+        if k == 1:
+            centroid = vectors.mean(axis=0, keepdims=True)
+        else:
+            kmeans = faiss.Kmeans(vectors.shape[1], k, niter=20, spherical=True, seed=seed, verbose=False)
+            kmeans.train(vectors)
+            centroid = kmeans.centroids
+        centroid = np.ascontiguousarray(centroid, dtype=np.float32)
+        faiss.normalize_L2(centroid)
+        return centroid
+
+    @classmethod
+    def build(cls, vectors_by_domain: Dict[str, np.ndarray], questions_by_domain: Dict[str, Sequence[str]] = None,
+              encode: Callable[[List[str]], np.ndarray] = None, prototypes: int = 8, calibration_size: int = 500,
+              max_train: int = 50000, seed: int = 0, embed_model: str = "",
+              temperature: float = None) -> "CentroidRouter":
+        """
+        ``questions_by_domain[name][i]`` is the question of the chunk behind
+        vector ``i``. The questions of the held-out rows are embedded with
+        ``encode`` and used as calibration queries; a domain without question
+        text falls back to its held-out chunk vectors. ``temperature`` skips
+        the fit. Raises ValueError when the fitted temperature lands on the
+        edge of TEMPERATURE_GRID.
+        """
+        rng = np.random.default_rng(seed)
+        names, blocks, starts, held_out, sources = [], [], [], [], {}
+        for label, (name, vectors) in enumerate(vectors_by_domain.items()):
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32).copy()
+            faiss.normalize_L2(vectors)
+            order = rng.permutation(len(vectors))
+            n_cal = min(calibration_size, len(vectors) // 5)
+            train = vectors[order[n_cal:][:max_train]]
+            starts.append(sum(len(b) for b in blocks))
+            blocks.append(cls._prototypes(train, prototypes, seed))
+            names.append(name)
+
+            questions = (questions_by_domain or {}).get(name)
+            texts = [questions[int(i)] for i in order[:n_cal]] if questions is not None and encode else []
+            texts = [t for t in texts if t]
+            if texts:
+                queries = np.ascontiguousarray(encode(texts), dtype=np.float32)
+                faiss.normalize_L2(queries)
+                sources[name] = "questions"
+            else:
+                queries = vectors[order[:n_cal]]
+                sources[name] = "chunks"
+            held_out.append((queries, label))
+
+        router = cls(np.vstack(blocks), np.asarray(starts), names, {"temperature": 1.0})
+        router.meta = dict(router._calibrate(held_out, temperature), embed_model=embed_model,
+                           prototypes=int(router.prototypes.shape[0]), calibration_source=sources)
+        router.temperature = router.meta["temperature"]
+        return router
+
+    def _domain_scores(self, queries: np.ndarray) -> np.ndarray:
+        """[N, dim] queries -> [N, D] max prototype similarity per domain"""
+        return np.maximum.reduceat(queries @ self.prototypes.T, self.starts, axis=1)
+
+    @staticmethod
+    def _nll(scores: np.ndarray, labels: np.ndarray, temperature: float) -> float:
+        logits = scores / temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        log_probs = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+        return float(-log_probs[np.arange(len(labels)), labels].mean())
+
+    def _calibrate(self, held_out: List[Tuple[np.ndarray, int]], temperature: float = None) -> Dict:
+        """Temperature minimizing the NLL of the true domain on the held-out calibration queries"""
+        if not any(len(v) for v, _ in held_out):
+            if temperature is None:
+                raise ValueError("No calibration queries; domains are too small to hold any out")
+            return {"temperature": float(temperature), "calibration_queries": 0}
+        queries = np.vstack([v for v, _ in held_out if len(v)])
+        labels = np.concatenate([np.full(len(v), label) for v, label in held_out if len(v)])
+        scores = self._domain_scores(queries)
+        if temperature is None:
+            nll = [self._nll(scores, labels, t) for t in TEMPERATURE_GRID]
+            best = int(np.argmin(nll))
+            temperature = float(TEMPERATURE_GRID[best])
+            if best in (0, len(TEMPERATURE_GRID) - 1):
+                # On the low edge the likelihood still improves as T shrinks, i.e. the calibration queries
+                # separate perfectly and the probabilities would be one-hot; neither edge is a real fit
+                raise ValueError(
+                    f"Router temperature fit hit the edge of the search grid (T={temperature:.3f}, "
+                    f"held-out top-1 {(scores.argmax(axis=1) == labels).mean():.3f}); the calibration queries "
+                    f"do not resemble real ones. Set the temperature explicitly instead")
+        return {
+            "temperature": temperature,
+            "calibration_nll": round(self._nll(scores, labels, temperature), 4),
+            "calibration_top1": round(float((scores.argmax(axis=1) == labels).mean()), 4),
+            "calibration_queries": int(len(labels)),
+        }
+
+    def save(self, path: str):
+        np.savez(path, prototypes=self.prototypes, starts=self.starts,
+                 names=np.asarray(json.dumps(self.names)), meta=np.asarray(json.dumps(self.meta)))
+
+    @classmethod
+    def load(cls, path: str) -> "CentroidRouter":
+        with np.load(path) as data:
+            return cls(data["prototypes"], data["starts"], json.loads(str(data["names"])),
+                       json.loads(str(data["meta"])))
+
+    # --------------------------------------------------------------------
+    # Routing
+    # --------------------------------------------------------------------
+    def probabilities(self, query_emb: np.ndarray, allowed: List[str] = None) -> Dict[str, float]:
+        """Calibrated P(domain | query) over the allowed domains (all by default)"""
+        scores = self._domain_scores(np.asarray(query_emb, dtype=np.float32).reshape(1, -1))[0]
+        if allowed is not None:
+            allowed = set(allowed)
+            scores = np.where([n in allowed for n in self.names], scores, -np.inf)
+        if not np.isfinite(scores).any():
+            return {}
+        logits = scores / self.temperature
+        probs = np.exp(logits - logits[np.isfinite(logits)].max())
+        probs /= probs.sum()
+        return {n: float(p) for n, p, s in zip(self.names, probs, scores) if np.isfinite(s)}
+
+    def route(self, query_emb: np.ndarray, threshold: float, max_domains: int,
+              allowed: List[str] = None) -> Tuple[List[str], Dict[str, float]]:
+        """(domains to search, probabilities): the top domain plus any other reaching `threshold`"""
+        probs = self.probabilities(query_emb, allowed)
+        ranked = sorted(probs, key=probs.get, reverse=True)
+        selected = ranked[:1] + [n for n in ranked[1:] if probs[n] >= threshold]
+        return selected[:max_domains], probs
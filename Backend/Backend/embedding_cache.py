@@ -0,0 +1,107 @@
+"""
+Query embedding cache for the Medical RAG pipeline
+Bounded LRU of query vectors in one preallocated float32 array, keyed on model and normalized query text
+"""
+
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from generation_cache import normalize_query
+
+
+class EmbeddingCache:
+    """
+    ``capacity`` query embeddings stored as rows of one float32
+    ``[capacity, dim]`` array (allocated on the first insert, when the
+    dimension is known). An OrderedDict maps ``(model key, normalized text)``
+    to a row; the least recently used row is reused when the cache is full.
+
+    The model key should name everything that changes the vector (model,
+    backend, normalization), e.g. ``"all-MiniLM-L6-v2:int8"``.
+    """
+
+    def __init__(self, capacity: int = 4096, dim: int = None):
+        self.capacity = capacity
+        self.vectors: Optional[np.ndarray] = None
+        self._slots: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if dim:
+            self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+
+    def get(self, model_key: str, text: str) -> Optional[np.ndarray]:
+        """(1, dim) copy of the cached vector, or None"""
+        key = (model_key, normalize_query(text))
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            self.hits += 1
+            return self.vectors[slot][None, :].copy()
+
+    def put(self, model_key: str, text: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        key = (model_key, normalize_query(text))
+        with self._lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+            elif len(vector) != self.vectors.shape[1]:
+                raise ValueError(f"Embedding dim {len(vector)} does not match cache dim {self.vectors.shape[1]}")
+            slot = self._slots.get(key)
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                    self.evictions += 1
+                self._slots[key] = slot
+            else:
+                self._slots.move_to_end(key)
+            self.vectors[slot] = vector
+
+    def encode(self, embedder, model_key: str, text: str, **encode_kwargs) -> np.ndarray:
+        """Cached ``embedder.encode([text], **encode_kwargs)`` as a (1, dim) float32 array"""
+        cached = self.get(model_key, text)
+        if cached is not None:
+            return cached
+        vector = embedder.encode([text], convert_to_numpy=True, **encode_kwargs).astype(np.float32)
+        self.put(model_key, text, vector[0])
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._slots),
+                "capacity": self.capacity,
+                "bytes": self.vectors.nbytes if self.vectors is not None else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_embedding_cache(capacity: int = 4096) -> EmbeddingCache:
+    """Process-wide cache used by every query entry point; `capacity` applies on the first call"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache(capacity)
+        return _shared_cache
@@ -0,0 +1,78 @@
+"""
+Hybrid score fusion for the Medical RAG pipeline
+Fuses dense (FAISS) and sparse (BM25) candidates over their union with vectorized NumPy
+"""
+
+import numpy as np
+from typing import Tuple
+
+
+FUSION_METHODS = ("rrf", "minmax", "zscore", "weighted")
+
+
+def _ranks(scores: np.ndarray) -> np.ndarray:
+    """1-based rank of each score within its list, best first"""
+    ranks = np.empty(len(scores), dtype=np.float64)
+    ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(scores) + 1)
+    return ranks
+
+
+def _normalize(scores: np.ndarray, method: str) -> np.ndarray:
+    if method == "minmax":
+        span = scores.max() - scores.min()
+        return (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+    if method == "zscore":
+        std = scores.std()
+        return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    return scores
+
+
+def fuse(dense_ids: np.ndarray, dense_scores: np.ndarray,
+         sparse_ids: np.ndarray, sparse_scores: np.ndarray,
+         method: str = "rrf", dense_weight: float = 0.6, sparse_weight: float = 0.4,
+         rrf_k: int = 60) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fuse two candidate lists over the union of their ids.
+
+    Methods:
+        rrf       weighted reciprocal rank fusion, w / (rrf_k + rank)
+        minmax    per-list min-max normalization, then weighted sum
+        zscore    per-list z-score normalization, then weighted sum
+        weighted  raw weighted sum (legacy behaviour; BM25 scale dominates)
+
+    A candidate missing from one list gets nothing from it under rrf and
+    "weighted", and that list's lowest normalized score under minmax/zscore.
+
+    Returns (ids, fused scores, raw dense scores with NaN where absent), sorted best first.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {FUSION_METHODS}")
+    dense_ids = np.asarray(dense_ids, dtype=np.int64)
+    sparse_ids = np.asarray(sparse_ids, dtype=np.int64)
+    dense_scores = np.asarray(dense_scores, dtype=np.float64)
+    sparse_scores = np.asarray(sparse_scores, dtype=np.float64)
+
+    ids = np.union1d(dense_ids, sparse_ids)
+    dense_pos = np.searchsorted(ids, dense_ids)
+    sparse_pos = np.searchsorted(ids, sparse_ids)
+    fused = np.zeros(len(ids), dtype=np.float64)
+
+    for pos, scores, weight in ((dense_pos, dense_scores, dense_weight),
+                                (sparse_pos, sparse_scores, sparse_weight)):
+        if not len(scores):
+            continue
+        if method == "rrf":
+            fused[pos] += weight / (rrf_k + _ranks(scores))
+        elif method == "weighted":
+            fused[pos] += weight * scores
+        else:
+            normalized = _normalize(scores, method)
+            column = np.full(len(ids), normalized.min())
+            column[pos] = normalized
+            fused += weight * column
+
+    dense_raw = np.full(len(ids), np.nan)
+    dense_raw[dense_pos] = dense_scores
+
+    order = np.argsort(-fused, kind="stable")
+    return ids[order], fused[order], dense_raw[order]
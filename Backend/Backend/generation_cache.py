@@ -0,0 +1,138 @@
+"""
+Generation cache for the Medical RAG pipeline
+Reuses T5 encoder states and generated answers when the same question meets the same reranked chunks
+"""
+
+import re
+import threading
+import torch
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace, drop trailing punctuation"""
+    return re.sub(r"\s+", " ", str(query).lower()).strip().rstrip("?!. ")
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values()) + 64
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 49
+    return 64
+
+
+class _ByteLRU:
+    """Thread-safe LRU bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, size)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def remove_where(self, predicate) -> int:
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                self.bytes -= self._data.pop(key)[1]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class GenerationCache:
+    """
+    Two LRU tiers sharing one memory cap, both keyed by the prompt-template
+    version, the ordered (domain, chunk id) list that built the prompt and
+    the normalized question:
+
+        answer   generated output per generation profile (decode skipped)
+        encoder  T5 encoder hidden states (encoder skipped; decode still runs,
+                 e.g. for another profile or the streaming path)
+
+    T5's encoder is bidirectional, so context states depend on the question
+    text as well; they are only reused for the same question and chunks.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entries: int = 512):
+        # Encoder states are large; answers are small and get a tenth of the budget
+        self.answers = _ByteLRU(max_entries, max_bytes // 10)
+        self.encoder = _ByteLRU(max_entries, max_bytes - max_bytes // 10)
+
+    @staticmethod
+    def key(template_version: int, chunk_ids: Sequence[Hashable], query: str) -> Tuple:
+        return template_version, tuple(chunk_ids), normalize_query(query)
+
+    def get_answer(self, key: Tuple, profile: str) -> Optional[Dict]:
+        return self.answers.get(key + (profile,))
+
+    def put_answer(self, key: Tuple, profile: str, output: Dict):
+        self.answers.put(key + (profile,), dict(output))
+
+    def get_encoder(self, key: Tuple) -> Optional[Dict]:
+        """{"hidden_states", "attention_mask"} or None"""
+        return self.encoder.get(key)
+
+    def put_encoder(self, key: Tuple, hidden_states: torch.Tensor, attention_mask: torch.Tensor):
+        self.encoder.put(key, {"hidden_states": hidden_states, "attention_mask": attention_mask})
+
+    def invalidate_domain(self, domain: str) -> int:
+        """Drop entries whose prompt used any chunk from `domain`"""
+        def uses_domain(key):
+            return any(chunk_domain == domain for chunk_domain, _ in key[1])
+        return self.answers.remove_where(uses_domain) + self.encoder.remove_where(uses_domain)
+
+    def clear(self):
+        self.answers.clear()
+        self.encoder.clear()
+
+    def stats(self) -> Dict:
+        return {"answer": self.answers.stats(), "encoder": self.encoder.stats()}
@@ -0,0 +1,94 @@
+"""
+Cross-request micro-batching for the Medical RAG pipeline
+Collects work from concurrent requests for a few milliseconds and runs one batched forward per model
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Queue in front of one model call.
+
+    ``submit(payload)`` returns a Future. A single worker thread takes the
+    first waiting payload, keeps collecting until ``max_batch_size`` items or
+    ``max_wait_ms`` have passed, then calls ``batch_fn(payloads)`` once and
+    resolves every Future with its element of the returned list. If the
+    batch call raises, every Future in that batch gets the exception.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._batches = 0
+        self._items = 0
+        self._worker = threading.Thread(target=self._run, name=f"microbatch-{name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, payload: Any) -> Future:
+        future = Future()
+        self._queue.put((payload, future))
+        return future
+
+    def __call__(self, payload: Any) -> Any:
+        return self.submit(payload).result()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._worker.join(timeout=5)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+        }
+
+    def _collect(self, first) -> List:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Finish this batch, then stop
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            payloads = [payload for payload, _ in batch]
+            try:
+                results = self.batch_fn(payloads)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._batches += 1
+            self._items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
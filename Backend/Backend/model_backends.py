@@ -0,0 +1,80 @@
+"""
+Model inference backends for the Medical RAG pipeline
+Loads the embedder, cross-encoder and generator as fp32 PyTorch, int8 dynamic-quantized PyTorch, or ONNX Runtime
+"""
+
+import os
+import torch
+from typing import Tuple
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from sentence_transformers import SentenceTransformer, CrossEncoder
+
+
+# torch  fp32 PyTorch (default)
+# int8   PyTorch with nn.Linear weights dynamically quantized to int8 (CPU only, no extra dependencies)
+# onnx   ONNX Runtime via optimum (pip install "optimum[onnxruntime]"); exported once, then reused
+MODEL_BACKENDS = ("torch", "int8", "onnx")
+
+
+def _check_backend(backend: str, device: torch.device) -> str:
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}', expected one of {MODEL_BACKENDS}")
+    if backend == "int8" and device.type != "cpu":
+        # Dynamic quantization kernels are CPU-only
+        print(f"  ⚠️ int8 backend needs CPU (device is {device}); using fp32")
+        return "torch"
+    return backend
+
+
+def quantize_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """Replace every nn.Linear with its int8 dynamic-quantized counterpart, in place"""
+    module.eval()
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _export_path(export_dir: str, model_name: str) -> str:
+    return os.path.join(export_dir, model_name.replace("/", "__"))
+
+
+def load_embedder(model_name: str, backend: str, device: torch.device) -> SentenceTransformer:
+    backend = _check_backend(backend, device)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device=str(device), backend="onnx")
+    embedder = SentenceTransformer(model_name, device=str(device))
+    if backend == "int8":
+        quantize_int8(embedder[0].auto_model)
+    return embedder
+
+
+def load_cross_encoder(model_name: str, backend: str, device: torch.device) -> CrossEncoder:
+    backend = _check_backend(backend, device)
+    if backend == "onnx":
+        return CrossEncoder(model_name, device=str(device), backend="onnx")
+    cross_encoder = CrossEncoder(model_name, device=str(device))
+    if backend == "int8":
+        quantize_int8(cross_encoder.model)
+    return cross_encoder
+
+
+def load_generator(model_name: str, backend: str, device: torch.device, export_dir: str) -> Tuple:
+    """(tokenizer, seq2seq model); ONNX encoder/decoder graphs are exported to export_dir on first use"""
+    backend = _check_backend(backend, device)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise ImportError('The onnx backend needs optimum: pip install "optimum[onnxruntime]"') from e
+        path = _export_path(export_dir, model_name)
+        if os.path.isdir(path):
+            model = ORTModelForSeq2SeqLM.from_pretrained(path)
+        else:
+            model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+            model.save_pretrained(path)
+            tokenizer.save_pretrained(path)
+        return tokenizer, model
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to(device)
+    if backend == "int8":
+        quantize_int8(model)
+    return tokenizer, model.eval()
@@ -10,15 +10,31 @@ import gc
 import numpy as np
 import torch
 import faiss
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from rank_bm25 import BM25Okapi
-from nltk.tokenize import word_tokenize, sent_tokenize
+from concurrent.futures import ThreadPoolExecutor, wait
+from transformers import TextIteratorStreamer
+from nltk.tokenize import sent_tokenize
 import nltk
 import warnings
+from threading import Event, Thread
+from contextlib import closing
+from bm25_index import CompiledBM25, tokenize
+from unified_index import UnifiedIndex
+from ann_index import apply_search_params, read_faiss_index
+from chunk_store import ChunkStore
+from fusion import fuse
+from reranking import RerankEngine
+from inference_scheduler import MicroBatcher
+from generation import CancelGeneration, EarlyQualityCheck, GenerationProfile, get_profile
+from model_backends import load_cross_encoder, load_embedder, load_generator
+from generation_cache import GenerationCache, normalize_query
+from answer_cache import SemanticAnswerCache
+from cache_backends import digest, domain_tag, open_cache_backend
+from embedding_cache import shared_embedding_cache
+from domain_residency import DomainResidencyManager
+from domain_router import CentroidRouter
+from transformers.modeling_outputs import BaseModelOutput
 
 warnings.filterwarnings("ignore")
 
@@ -41,6 +57,22 @@ class DomainConfig:
     dataset_name: str
     index_path: str
     id2doc_path: str
+    bm25_path: str = ""
+    chunks_path: str = ""
+
+    def __post_init__(self):
+        # Compiled artifacts live next to the FAISS index unless overridden
+        base_dir = os.path.dirname(self.index_path)
+        if not self.bm25_path:
+            self.bm25_path = os.path.join(base_dir, f"{self.name}_bm25")
+        if not self.chunks_path:
+            self.chunks_path = os.path.join(base_dir, f"{self.name}_chunks")
+
+    def ann_index_path(self, kind: str) -> str:
+        """Path of an index variant built by build_artifacts.py --ann ("flat" is the notebook index)"""
+        if kind == "flat":
+            return self.index_path
+        return os.path.join(os.path.dirname(self.index_path), f"{self.name}_{kind}.faiss")
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -66,22 +98,120 @@ DOMAINS = [
                  os.path.join(INDEXES_DIR, "Diabetes-Digestive-Kidney_docs.pkl")),
     DomainConfig("Neurology", "Neurology Medical QA",
                  os.path.join(INDEXES_DIR, "Neurology_index.faiss"),
-                 os.path.join(INDEXES_DIR, "Neurology_docs.pkl"))
+                 os.path.join(INDEXES_DIR, "Neurology_docs.pkl")),
+    # Notebook domains; loaded on demand within RAGConfig.DOMAIN_MEMORY_BUDGET_MB when their indexes are present
+    DomainConfig("general_medical", "General Medical",
+                 os.path.join(INDEXES_DIR, "general_medical_faiss.index"),
+                 os.path.join(INDEXES_DIR, "general_medical_id2doc.pkl")),
+    DomainConfig("mental_health", "Mental Health",
+                 os.path.join(INDEXES_DIR, "mental_health_faiss.index"),
+                 os.path.join(INDEXES_DIR, "mental_health_id2doc.pkl")),
+    DomainConfig("ophthalmology", "Ophthalmology",
+                 os.path.join(INDEXES_DIR, "ophthalmology_faiss.index"),
+                 os.path.join(INDEXES_DIR, "ophthalmology_id2doc.pkl")),
+    DomainConfig("pediatrics", "Pediatrics",
+                 os.path.join(INDEXES_DIR, "pediatrics_faiss.index"),
+                 os.path.join(INDEXES_DIR, "pediatrics_id2doc.pkl")),
+    DomainConfig("symptoms_triage", "Symptoms Triage",
+                 os.path.join(INDEXES_DIR, "symptoms_triage_faiss.index"),
+                 os.path.join(INDEXES_DIR, "symptoms_triage_id2doc.pkl")),
+    DomainConfig("women_health", "Women's Health",
+                 os.path.join(INDEXES_DIR, "women_health_faiss.index"),
+                 os.path.join(INDEXES_DIR, "women_health_id2doc.pkl")),
 ]
 
+# Optional single index holding every domain's vectors (see build_artifacts.py --unified)
+UNIFIED_INDEX_PATH = os.path.join(INDEXES_DIR, "unified_index")
+# Domain-routing prototypes (see build_artifacts.py --router)
+DOMAIN_ROUTER_PATH = os.path.join(INDEXES_DIR, "domain_router.npz")
+# ONNX exports of the generator (MODEL_BACKEND = "onnx")
+MODEL_EXPORT_DIR = os.path.join(CHECKPOINT_BASE, "exported_models")
+
+
+def load_id2doc(path: str) -> List:
+    """Load a pickled chunk list (dict-shaped pickles are flattened to their values)"""
+    with open(path, "rb") as f:
+        id2doc = pickle.load(f)
+    if isinstance(id2doc, dict):
+        id2doc = list(id2doc.values())
+    return id2doc
+
+
+def load_chunks(domain: DomainConfig, mmap: bool = True) -> ChunkStore:
+    """Open the compiled chunk store, converting the pickle in memory if it was not built"""
+    if ChunkStore.exists(domain.chunks_path):
+        return ChunkStore.open(domain.chunks_path, mmap=mmap)
+    print(f"    ⚠️ No chunk store for {domain.name} (run `python build_artifacts.py`)")
+    return ChunkStore.from_docs(load_id2doc(domain.id2doc_path), domain=domain.name)
+
 
 class RAGConfig:
     """Memory-optimized configuration"""
     EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
     RERANK_MODEL = "BAAI/bge-reranker-base"
     GENERATOR_MODEL = "google/flan-t5-base"
+    MODEL_BACKEND = "torch"  # "torch" (fp32) | "int8" (dynamic quantization, CPU) | "onnx" (ONNX Runtime via optimum)
     FAISS_TOP_K = 30
     BM25_TOP_K = 30
     FINAL_TOP_K = 5
     FAISS_WEIGHT = 0.6
     BM25_WEIGHT = 0.4
+    FUSION_METHOD = "rrf"  # "rrf" | "minmax" | "zscore" | "weighted" (raw scores, legacy)
+    RRF_K = 60
+    RERANK_CASCADE = True  # Prune before the cross-encoder and stop early on a decisive winner
+    RERANK_BUDGET = 20  # Candidates kept by fused score
+    RERANK_FIRST_STAGE_K = 12  # Survivors of the bi-encoder similarity stage
+    RERANK_BATCH_SIZE = 8  # Cross-encoder pairs scored per cascade step
+    RERANK_EARLY_EXIT_MARGIN = 0.35  # Stop once the top score leads the runner-up by this much
+    RERANK_DYNAMIC_BATCHING = True  # Length-bucketed cross-encoder batches (RerankEngine)
+    RERANK_TOKEN_BUDGET = 8192  # Max padded tokens per cross-encoder batch
+    RERANK_TOKEN_CACHE_SIZE = 20000  # Chunks whose token ids are kept for reuse
+    MICRO_BATCHING = False  # Batch embed/rerank/generate calls across concurrent requests
+    MICRO_BATCH_MAX_SIZE = 16  # Max requests per embedder/reranker forward
+    MICRO_BATCH_MAX_WAIT_MS = 5.0  # How long the first request waits for company
+    GENERATE_MAX_BATCH_SIZE = 4  # Max prompts per batched generate()
+    GENERATION_PROFILE = "quality"  # "fast" (greedy + early check) | "balanced" | "quality" (beam 4); see generation.py
+    ANSWER_GRADING = False  # Add a "grading" field (retrieval / faithfulness / composite); costs one answer embedding
+    GENERATION_CACHE = True  # Reuse encoder states / answers for the same question over the same chunks
+    GENERATION_CACHE_MAX_MB = 256
+    GENERATION_CACHE_MAX_ENTRIES = 512
+    ANSWER_CACHE = True  # Serve repeated / paraphrased questions from stored results (emergencies bypass it)
+    ANSWER_CACHE_MAX_ENTRIES = 2000
+    ANSWER_CACHE_TTL_S = 3600.0
+    ANSWER_CACHE_SIMILARITY = 0.92  # Min cosine between query embeddings for a semantic hit
+    QUERY_EMBEDDING_CACHE_SIZE = 4096  # In-process LRU of query vectors (0 disables)
+    CACHE_BACKEND = None  # Shared embedding/retrieval/answer cache: None | "memory" | "sqlite" | "redis"
+    CACHE_SQLITE_PATH = os.path.join(CHECKPOINT_BASE, "rag_cache.sqlite3")
+    CACHE_REDIS_URL = "redis://localhost:6379/0"
+    CACHE_TTL_S = 3600.0
+    CACHE_MAX_ENTRIES = 100000  # memory / sqlite backends; Redis uses its own maxmemory policy
     MAX_CONTEXT_LENGTH = 512
     MAX_ANSWER_LENGTH = 256
+    UNIFIED_INDEX = False  # One merged FAISS index with domain-id filtering
+    FAISS_INDEX_TYPE = "flat"  # "flat" | "ivf_flat" | "ivf_pq" | "hnsw"
+    FAISS_NPROBE = 16  # IVF lists probed per query
+    FAISS_EF_SEARCH = 64  # HNSW candidate list size per query
+    MMAP_INDEXES = True  # mmap FAISS indexes and chunk stores (shared page cache across workers)
+    RETRIEVAL_WORKERS = 5  # Long-lived threads for per-domain retrieval fan-out
+    DOMAIN_DEADLINE_S = 10.0  # Per-query wait for domain retrieval before it is dropped
+    TORCH_THREADS = None  # torch intra-op threads (None = torch default)
+    FAISS_THREADS = 1  # OpenMP threads per FAISS search; parallelism comes from RETRIEVAL_WORKERS
+    DOMAIN_MEMORY_BUDGET_MB = 4096  # FAISS + BM25 + chunk data resident across domains (None = unlimited)
+    PINNED_DOMAINS = ["Cancer", "Cardiology", "Dermatology", "Diabetes-Digestive-Kidney", "Neurology"]  # Loaded at startup, never evicted
+    DOMAIN_LOAD_WORKERS = 2  # Background threads loading cold domains
+    DOMAIN_LOAD_WAIT_S = 3.0  # How long a query waits for a cold domain before answering without it
+    DOMAIN_LOAD_RETRY_S = 30.0  # After a failed load, wait this long before retrying (doubles per failure)
+    DOMAIN_ROUTER = True  # Route by query embedding vs. domain prototypes (build_artifacts.py --router); keywords otherwise
+    ROUTER_FANOUT_THRESHOLD = 0.2  # Also search any other domain whose calibrated probability reaches this
+    ROUTER_MAX_DOMAINS = 3
+
+
+class RetrievalError(RuntimeError):
+    """Raised when every routed domain failed to return candidates"""
+
+
+# Bump whenever _build_prompt changes; part of every generation cache key
+PROMPT_TEMPLATE_VERSION = 1
 
 
 config = RAGConfig()
@@ -103,49 +233,270 @@ class MemoryEfficientRAGPipeline:
         print("🏥 INITIALIZING MEDICAL RAG SYSTEM")
         print("=" * 80)
 
+        self._configure_threads()
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=config.RETRIEVAL_WORKERS,
+                                                     thread_name_prefix="rag-retrieval")
+
         # Load small embedder
-        print("\n📦 Loading lightweight embedder...")
-        self.embedder = SentenceTransformer(config.EMBED_MODEL, device=device)
+        print(f"\n📦 Loading lightweight embedder... (backend: {config.MODEL_BACKEND})")
+        self.embedder = load_embedder(config.EMBED_MODEL, config.MODEL_BACKEND, device)
+        self.embedding_cache = (shared_embedding_cache(config.QUERY_EMBEDDING_CACHE_SIZE)
+                                if config.QUERY_EMBEDDING_CACHE_SIZE else None)
         print("  ✅ Embedder loaded (80MB)")
 
-        self.loaded_domains = {}
-        self._load_all_domains()
+        self.unified_index = self._load_unified_index()
+        self.available_domains = self._available_domains()
+        self.domain_router = self._load_domain_router()
+        self.loaded_domains = DomainResidencyManager(
+            self._load_domain, budget_mb=config.DOMAIN_MEMORY_BUDGET_MB,
+            pinned=[d for d in config.PINNED_DOMAINS if d in self.available_domains],
+            load_workers=config.DOMAIN_LOAD_WORKERS, retry_s=config.DOMAIN_LOAD_RETRY_S)
+        self._preload_domains()
 
-        self.reranker = CrossEncoder(config.RERANK_MODEL, device=device)
+        self.reranker = load_cross_encoder(config.RERANK_MODEL, config.MODEL_BACKEND, device)
+        self.rerank_engine = RerankEngine(
+            self.reranker, token_budget=config.RERANK_TOKEN_BUDGET,
+            cache_size=config.RERANK_TOKEN_CACHE_SIZE) if config.RERANK_DYNAMIC_BATCHING else None
         print("  ✅ Reranker loaded (300MB)")
 
-        self.generator_tokenizer = AutoTokenizer.from_pretrained(config.GENERATOR_MODEL)
-        self.generator_model = AutoModelForSeq2SeqLM.from_pretrained(config.GENERATOR_MODEL).to(device)
+        self.generator_tokenizer, self.generator_model = load_generator(
+            config.GENERATOR_MODEL, config.MODEL_BACKEND, device, MODEL_EXPORT_DIR)
         print("  ✅ Generator loaded (900MB)")
 
+        self.generation_cache = GenerationCache(
+            max_bytes=config.GENERATION_CACHE_MAX_MB * 1024 * 1024,
+            max_entries=config.GENERATION_CACHE_MAX_ENTRIES) if config.GENERATION_CACHE else None
+
+        self.answer_cache = SemanticAnswerCache(
+            self.embedder.get_sentence_embedding_dimension(), max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_s=config.ANSWER_CACHE_TTL_S, threshold=config.ANSWER_CACHE_SIMILARITY) if config.ANSWER_CACHE else None
+
+        self.shared_cache = self._open_shared_cache()
+
+        self.batchers = self._start_batchers() if config.MICRO_BATCHING else None
+
         print("\n✅ Pipeline initialized")
-        print(f"💾 Domains: {len(domains)} loaded in memory")
+        print(f"💾 Domains: {len(self.loaded_domains)} resident, {len(self.available_domains)} available, "
+              f"{len(domains)} configured")
         print("=" * 80)
 
     # --------------------------------------------------------------------
     # Domain Loading
     # --------------------------------------------------------------------
-    def _load_all_domains(self):
-        print("\n⚡ Preloading all domain indexes for faster responses...")
-        for domain in self.domain_configs.values():
-            if os.path.exists(domain.index_path):
-                print(f"  📂 Loading {domain.name} index...")
-                try:
-                    index = faiss.read_index(domain.index_path)
-                    with open(domain.id2doc_path, "rb") as f:
-                        id2doc = pickle.load(f)
-                    if isinstance(id2doc, dict):
-                        id2doc = list(id2doc.values())
-                    bm25 = BM25Okapi([word_tokenize(str(doc).lower()) for doc in id2doc])
-                    self.loaded_domains[domain.name] = {
-                        "faiss_index": index,
-                        "bm25_index": bm25,
-                        "id2doc": id2doc
-                    }
-                    print(f"    ✅ Loaded {len(id2doc)} chunks")
-                except Exception as e:
-                    print(f"    ❌ Failed to load {domain.name}: {e}")
-        print("✅ All domain indexes preloaded.")
+    def _configure_threads(self):
+        """Keep torch, FAISS/OpenMP and the retrieval pool from oversubscribing cores"""
+        if self.config.TORCH_THREADS:
+            torch.set_num_threads(self.config.TORCH_THREADS)
+        if self.config.FAISS_THREADS:
+            faiss.omp_set_num_threads(self.config.FAISS_THREADS)
+        print(f"  🧵 Threads: torch={torch.get_num_threads()}, faiss={self.config.FAISS_THREADS or 'default'}, "
+              f"retrieval workers={self.config.RETRIEVAL_WORKERS}")
+
+    def after_fork(self, torch_threads: int = None):
+        """
+        Re-create per-process resources in a forked worker. Model weights and
+        indexes stay shared copy-on-write; threads and connections do not
+        survive fork, so the retrieval pool, micro-batchers and shared-cache
+        client are rebuilt (the parent's objects are dropped, not closed).
+        The parent must have loaded single-threaded (see prefork.py); the
+        per-worker torch / FAISS thread counts are applied here.
+        """
+        if torch_threads:
+            self.config.TORCH_THREADS = torch_threads
+        self._configure_threads()
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=self.config.RETRIEVAL_WORKERS,
+                                                     thread_name_prefix="rag-retrieval")
+        self.loaded_domains.after_fork()
+        self.shared_cache = self._open_shared_cache()
+        self.batchers = self._start_batchers() if self.config.MICRO_BATCHING else None
+
+    def close(self):
+        self.retrieval_executor.shutdown(wait=False, cancel_futures=True)
+        self.loaded_domains.close()
+        if self.shared_cache is not None:
+            self.shared_cache.close()
+        for batcher in (self.batchers or {}).values():
+            batcher.close()
+
+    # --------------------------------------------------------------------
+    # Shared cache (embeddings, retrieval results, answers)
+    # --------------------------------------------------------------------
+    def _open_shared_cache(self):
+        cfg = self.config
+        if not cfg.CACHE_BACKEND:
+            return None
+        cache = open_cache_backend(cfg.CACHE_BACKEND, sqlite_path=cfg.CACHE_SQLITE_PATH,
+                                   redis_url=cfg.CACHE_REDIS_URL, max_entries=cfg.CACHE_MAX_ENTRIES)
+        # Everything that changes retrieval or answers is part of the key, so stale entries are never read
+        self._cache_version = digest(json.dumps([
+            cfg.EMBED_MODEL, cfg.RERANK_MODEL, cfg.GENERATOR_MODEL, cfg.MODEL_BACKEND,
+            cfg.FAISS_TOP_K, cfg.BM25_TOP_K, cfg.FUSION_METHOD, cfg.RRF_K, cfg.FAISS_WEIGHT, cfg.BM25_WEIGHT,
+            cfg.FAISS_INDEX_TYPE, cfg.UNIFIED_INDEX, cfg.ANSWER_GRADING, PROMPT_TEMPLATE_VERSION]))[:12]
+        print(f"  🗄️ Shared cache: {cfg.CACHE_BACKEND} (version {self._cache_version})")
+        return cache
+
+    def _shared_key(self, kind: str, query: str, domains: List[str] = None, profile: str = "") -> str:
+        if kind == "emb":
+            return f"emb:{self.config.EMBED_MODEL}:{self.config.MODEL_BACKEND}:{digest(normalize_query(query))}"
+        return f"{kind}:{self._cache_version}:{profile}:{domain_tag(domains)}:{digest(normalize_query(query))}"
+
+    def _cached_retrieval(self, query: str, domains: List[str], query_emb: np.ndarray) -> List[Dict]:
+        """hybrid_retrieval through the shared cache; only complete results (no failed domain) are stored"""
+        if self.shared_cache is None:
+            return self.hybrid_retrieval(query, domains, query_emb=query_emb)
+        key = self._shared_key("ret", query, domains)
+        rows = self.shared_cache.get_value(key)
+        resident = {domain: self.loaded_domains.get(domain) for domain in {row[0] for row in rows or []}}
+        if rows is not None and all(data is not None for data in resident.values()):
+            # Stored without chunk text; rows are (domain, chunk id, fused score, dense score)
+            return [{"domain": domain, "chunk": resident[domain]["id2doc"][chunk_id],
+                     "chunk_id": chunk_id, "score": score, "dense_score": dense,
+                     "faiss_index": resident[domain]["faiss_index"]}
+                    for domain, chunk_id, score, dense in rows]
+
+        stats = {}
+        candidates = self.hybrid_retrieval(query, domains, query_emb=query_emb, stats=stats)
+        if not stats["failed_domains"]:
+            self.shared_cache.set_value(key, [[c["domain"], c["chunk_id"], c["score"], c["dense_score"]]
+                                              for c in candidates], self.config.CACHE_TTL_S)
+        return candidates
+
+    # --------------------------------------------------------------------
+    # Cross-request micro-batching
+    # --------------------------------------------------------------------
+    def _start_batchers(self) -> Dict[str, MicroBatcher]:
+        cfg = self.config
+        print(f"  📦 Micro-batching on (max {cfg.MICRO_BATCH_MAX_SIZE}, wait {cfg.MICRO_BATCH_MAX_WAIT_MS}ms)")
+        return {
+            "embed": MicroBatcher("embed", self._embed_batch, cfg.MICRO_BATCH_MAX_SIZE, cfg.MICRO_BATCH_MAX_WAIT_MS),
+            "rerank": MicroBatcher("rerank", self._rerank_batch, cfg.MICRO_BATCH_MAX_SIZE, cfg.MICRO_BATCH_MAX_WAIT_MS),
+            "generate": MicroBatcher("generate", self._generate_batch, cfg.GENERATE_MAX_BATCH_SIZE,
+                                     cfg.MICRO_BATCH_MAX_WAIT_MS),
+        }
+
+    def batching_stats(self) -> Dict:
+        return {name: b.stats() for name, b in (self.batchers or {}).items()}
+
+    def _embed_batch(self, queries: List[str]) -> List[np.ndarray]:
+        embs = self.embedder.encode(queries, convert_to_numpy=True, normalize_embeddings=True,
+                                    show_progress_bar=False).astype("float32")
+        return list(embs)
+
+    def _rerank_batch(self, payloads: List) -> List[np.ndarray]:
+        """payloads: (query, [(chunk key, text)], stats) per request"""
+        if self.rerank_engine is not None:
+            return self.rerank_engine.predict_many([(q, chunks) for q, chunks, _ in payloads],
+                                                   [stats for _, _, stats in payloads])
+        pairs = [[q, text] for q, chunks, _ in payloads for _, text in chunks]
+        scores = self.reranker.predict(pairs, show_progress_bar=False)
+        results, start = [], 0
+        for _, chunks, _ in payloads:
+            results.append(scores[start:start + len(chunks)])
+            start += len(chunks)
+        return results
+
+    def _generate_batch(self, payloads: List) -> List[Dict]:
+        """payloads: (prompt, profile name); one generate() per profile group"""
+        results = [None] * len(payloads)
+        groups = {}
+        for i, (_, profile_name) in enumerate(payloads):
+            groups.setdefault(profile_name, []).append(i)
+        for profile_name, positions in groups.items():
+            outputs = self._generate_texts([payloads[i][0] for i in positions], get_profile(profile_name))
+            for i, output in zip(positions, outputs):
+                results[i] = output
+        return results
+
+    def _load_unified_index(self):
+        if not self.config.UNIFIED_INDEX:
+            return None
+        if not UnifiedIndex.exists(UNIFIED_INDEX_PATH):
+            print("  ⚠️ UNIFIED_INDEX is on but no unified index was built; using per-domain indexes")
+            return None
+        unified = UnifiedIndex.load(UNIFIED_INDEX_PATH, mmap=self.config.MMAP_INDEXES)
+        apply_search_params(unified.index, self.config.FAISS_NPROBE, self.config.FAISS_EF_SEARCH)
+        print(f"  ✅ Unified index loaded ({unified.index.ntotal} vectors, {len(unified.domains)} domains)")
+        return unified
+
+    def _in_unified(self, name: str) -> bool:
+        return self.unified_index is not None and name in self.unified_index.domains
+
+    def _load_domain_router(self):
+        if not self.config.DOMAIN_ROUTER:
+            return None
+        if not os.path.exists(DOMAIN_ROUTER_PATH):
+            print("  ⚠️ DOMAIN_ROUTER is on but no router was built (run `python build_artifacts.py --router`); "
+                  "using keyword routing")
+            return None
+        router = CentroidRouter.load(DOMAIN_ROUTER_PATH)
+        built_for = router.meta.get("embed_model")
+        if built_for != self.config.EMBED_MODEL or router.dim != self.embedder.get_sentence_embedding_dimension():
+            print(f"  ⚠️ Domain router was built for {built_for} ({router.dim}d), not {self.config.EMBED_MODEL}; "
+                  f"using keyword routing (rebuild with `python build_artifacts.py --router`)")
+            return None
+        uncovered = [d for d in self.available_domains if d not in router.names]
+        if uncovered:
+            print(f"  ⚠️ Domain router does not cover {uncovered}; rebuild it to route there")
+        print(f"  ✅ Domain router loaded ({len(router.names)} domains, {router.prototypes.shape[0]} prototypes, "
+              f"held-out top-1 {router.meta.get('calibration_top1', 0):.3f})")
+        return router
+
+    def _available_domains(self) -> List[str]:
+        """Configured domains whose index (on disk or in the unified index) and chunks are present"""
+        available = [d.name for d in self.domain_configs.values()
+                     if (self._in_unified(d.name) or os.path.exists(d.index_path)) and
+                     (ChunkStore.exists(d.chunks_path) or os.path.exists(d.id2doc_path))]
+        missing = [name for name in self.domain_configs if name not in available]
+        if missing:
+            print(f"  ⚠️ No index or chunks for {missing}; these domains are skipped")
+        return available
+
+    def _preload_domains(self):
+        """Load pinned domains now; the rest load on first use (see DomainResidencyManager)"""
+        pinned = sorted(self.loaded_domains.pinned)
+        print(f"\n⚡ Preloading pinned domains {pinned}; "
+              f"{len(self.available_domains) - len(pinned)} more load on demand "
+              f"(budget {self.config.DOMAIN_MEMORY_BUDGET_MB or 'unlimited'} MB)...")
+        loaded = self.loaded_domains.preload(pinned)
+        print(f"✅ {len(loaded)}/{len(pinned)} pinned domains loaded.")
+
+    def _load_domain(self, name: str) -> Tuple[Dict, int]:
+        """FAISS index, BM25 index and chunk store for one domain -> (data, approximate bytes)"""
+        domain = self.domain_configs[name]
+        index, index_bytes = (None, 0) if self._in_unified(name) else self._read_faiss_index(domain)
+        id2doc = load_chunks(domain, mmap=self.config.MMAP_INDEXES)
+        bm25 = self._load_bm25(domain, id2doc)
+        data = {
+            "faiss_index": index,
+            "bm25_index": bm25,
+            "id2doc": id2doc
+        }
+        return data, index_bytes + bm25.nbytes + id2doc.nbytes
+
+    def _read_faiss_index(self, domain: DomainConfig) -> Tuple[faiss.Index, int]:
+        """Read the configured index variant (falling back to the exact notebook index) -> (index, file bytes)"""
+        kind = self.config.FAISS_INDEX_TYPE
+        path = domain.ann_index_path(kind)
+        if not os.path.exists(path):
+            print(f"    ⚠️ No {kind} index for {domain.name} (run `python build_artifacts.py --ann {kind}`)")
+            path = domain.index_path
+        index = read_faiss_index(path, mmap=self.config.MMAP_INDEXES)
+        return apply_search_params(index, self.config.FAISS_NPROBE, self.config.FAISS_EF_SEARCH), os.path.getsize(path)
+
+    def _load_bm25(self, domain: DomainConfig, id2doc: ChunkStore) -> CompiledBM25:
+        """Memory-map the compiled BM25 artifact, building in memory only as a fallback"""
+        if os.path.exists(os.path.join(domain.bm25_path, "meta.json")):
+            try:
+                bm25 = CompiledBM25.load(domain.bm25_path)
+                if bm25.n_docs == len(id2doc):
+                    return bm25
+                print(f"    ⚠️ Compiled BM25 for {domain.name} is stale ({bm25.n_docs} docs vs {len(id2doc)})")
+            except Exception as e:
+                print(f"    ⚠️ Could not load compiled BM25 for {domain.name}: {e}")
+        else:
+            print(f"    ⚠️ No compiled BM25 for {domain.name} (run `python build_artifacts.py`)")
+        print(f"    🔨 Building BM25 in memory for {domain.name}...")
+        return CompiledBM25.build(tokenize(id2doc.search_text(i)) for i in range(len(id2doc)))
 
     # --------------------------------------------------------------------
     # Utility
@@ -165,16 +516,43 @@ class MemoryEfficientRAGPipeline:
     # --------------------------------------------------------------------
     # Domain Routing
     # --------------------------------------------------------------------
-    def route_to_domains(self, query: str) -> List[str]:
+    def route_to_domains(self, query: str, query_emb: np.ndarray = None, stats: Dict = None) -> List[str]:
+        """
+        Domains to search. With a domain router: calibrated P(domain | query
+        embedding), the top domain plus any other above ROUTER_FANOUT_THRESHOLD.
+        Otherwise (or if the router covers no available domain) keyword matching.
+        `stats` receives the method and per-domain scores.
+        """
+        if self.domain_router is not None:
+            q_emb = query_emb if query_emb is not None else self.encode_query(query)
+            domains, probs = self.domain_router.route(q_emb, self.config.ROUTER_FANOUT_THRESHOLD,
+                                                      self.config.ROUTER_MAX_DOMAINS, allowed=self.available_domains)
+            if domains:
+                top = sorted(probs.items(), key=lambda kv: kv[1], reverse=True)[:5]
+                print(f"  🧭 Domain probabilities: {', '.join(f'{d}={p:.2f}' for d, p in top)}")
+                print(f"  ✅ Selected domains: {domains}")
+                if stats is not None:
+                    stats.update(method="centroid", scores={d: round(p, 4) for d, p in top})
+                return domains
+        return self._keyword_route(query, stats)
+
+    def _keyword_route(self, query: str, stats: Dict = None) -> List[str]:
         domain_keywords = {
             "Cancer": ["cancer", "tumor", "chemotherapy", "oncology", "malignant"],
             "Cardiology": ["heart", "cardiac", "blood pressure", "artery", "cardiovascular"],
             "Dermatology": ["skin", "rash", "eczema", "acne", "dermatitis"],
             "Diabetes-Digestive-Kidney": ["diabetes", "kidney", "digestive", "stomach", "liver", "insulin"],
-            "Neurology": ["brain", "headache", "migraine", "seizure", "neurological", "nervous"]
+            "Neurology": ["brain", "headache", "migraine", "seizure", "neurological", "nervous"],
+            "mental_health": ["anxiety", "panic", "depression", "stress", "mental"],
+            "ophthalmology": ["eye", "vision", "sight", "blind", "cataract"],
+            "pediatrics": ["child", "children", "baby", "infant", "year-old"],
+            "symptoms_triage": ["fever", "pain", "bleeding", "urgent"],
+            "women_health": ["period", "pregnancy", "pregnant", "menstrual", "menopause"]
         }
         query_lower = query.lower()
-        scores = {d: sum(1 for k in ks if k in query_lower) for d, ks in domain_keywords.items()}
+        # Only domains with an index on disk can be searched
+        scores = {d: sum(1 for k in ks if k in query_lower) for d, ks in domain_keywords.items()
+                  if d in self.available_domains}
         max_score = max(scores.values()) if scores.values() else 0
         
         # Debug: print scores
@@ -182,61 +560,215 @@ class MemoryEfficientRAGPipeline:
         print(f"  🎯 Max score: {max_score}")
         
         top = [d for d, s in scores.items() if s == max_score and s > 0]
-        result = top if top else ["Cardiology"]
+        fallback = "general_medical" if "general_medical" in self.available_domains else "Cardiology"
+        result = top if top else [fallback]
+        if stats is not None:
+            stats.update(method="keyword", scores={d: s for d, s in scores.items() if s})
         print(f"  ✅ Selected domains: {result}")
         return result
 
     # --------------------------------------------------------------------
     # Retrieval
     # --------------------------------------------------------------------
-    def hybrid_retrieval(self, query: str, domain_names: List[str]) -> List[Dict]:
-        all_results = []
-
-        def process(domain_name):
-            data = self.loaded_domains[domain_name]
-            q_emb = self.embedder.encode([query], convert_to_numpy=True, normalize_embeddings=True).astype("float32")
-            D, I = data["faiss_index"].search(q_emb, self.config.FAISS_TOP_K)
-            faiss_scores = {i: float(d) for i, d in zip(I[0], D[0])}
-            tokenized = word_tokenize(query.lower())
-            bm25_scores = data["bm25_index"].get_scores(tokenized)
-            bm25_top = np.argsort(bm25_scores)[::-1][:self.config.BM25_TOP_K]
-            for idx in bm25_top:
-                score = (self.config.FAISS_WEIGHT * faiss_scores.get(idx, 0)) + \
-                        (self.config.BM25_WEIGHT * bm25_scores[idx])
-                all_results.append({
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embed the query once per request; shape (1, dim), float32, L2-normalized"""
+        # int8 / ONNX backends produce slightly different vectors, so the backend is part of the key
+        model_key = f"{self.config.EMBED_MODEL}:{self.config.MODEL_BACKEND}"
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(model_key, query)
+            if cached is not None:
+                return cached
+        key = self._shared_key("emb", query) if self.shared_cache is not None else None
+        if key:
+            cached = self.shared_cache.get_value(key)
+            if cached is not None:
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(model_key, query, cached[0])
+                return cached
+        if self.batchers is not None:
+            query_emb = self.batchers["embed"](query)[None, :]
+        else:
+            query_emb = self.embedder.encode([query], convert_to_numpy=True, normalize_embeddings=True,
+                                             show_progress_bar=False).astype("float32")
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(model_key, query, query_emb[0])
+        if key:
+            self.shared_cache.set_value(key, query_emb, self.config.CACHE_TTL_S)
+        return query_emb
+
+    def _fan_out(self, fn, domain_names: List[str], failures: Dict = None) -> Dict[str, List[Dict]]:
+        """
+        Run fn(domain) on the shared retrieval pool -> {domain: results}, within the deadline.
+        Failed or late domains are logged and added to `failures` ({domain: exception}).
+        """
+        futures = {self.retrieval_executor.submit(fn, name): name for name in domain_names}
+        done, not_done = wait(futures, timeout=self.config.DOMAIN_DEADLINE_S)
+
+        results, errors = {}, {}
+        for future in not_done:
+            future.cancel()
+            errors[futures[future]] = TimeoutError(f"exceeded {self.config.DOMAIN_DEADLINE_S}s deadline")
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+        for name, e in errors.items():
+            print(f"  ❌ Retrieval failed for {name}: {type(e).__name__}: {e}")
+        if failures is not None:
+            failures.update(errors)
+        if errors and not results:
+            name, e = next(iter(errors.items()))
+            raise RetrievalError(f"All {len(errors)} domain(s) failed, first: {name}: {e}") from e
+        return results
+
+    def hybrid_retrieval(self, query: str, domain_names: List[str], query_emb: np.ndarray = None,
+                         stats: Dict = None) -> List[Dict]:
+        """
+        Fused dense + BM25 candidates. Cold domains are loaded in the background and
+        waited for up to DOMAIN_LOAD_WAIT_S; `stats["failed_domains"]` lists
+        unavailable, still-loading, failed or late domains.
+        """
+        unavailable = [d for d in domain_names if d not in self.available_domains]
+        if unavailable:
+            print(f"  ⚠️ Domains not available, skipping: {unavailable}")
+        resident, cold = self.loaded_domains.acquire(
+            [d for d in domain_names if d in self.available_domains], self.config.DOMAIN_LOAD_WAIT_S)
+        if cold:
+            print(f"  ⏳ Domains still loading, answering without: {cold}")
+        if stats is not None:
+            stats["failed_domains"] = unavailable + cold
+        domain_names = [d for d in domain_names if d in resident]
+        if not domain_names:
+            return []
+        q_emb = query_emb if query_emb is not None else self.encode_query(query)
+
+        dense_hits = None
+        if self.unified_index is not None:
+            # One global top-k over the routed domains, same candidate budget as per-domain search
+            dense_hits = self.unified_index.search(
+                q_emb, self.config.FAISS_TOP_K * len(domain_names), domain_names)
+
+        def process(domain_name) -> List[Dict]:
+            # Held for the whole search, so an eviction meanwhile cannot pull the index away
+            data = resident[domain_name]
+            results = []
+            if data["faiss_index"] is None:
+                hits = dense_hits.get(domain_name, {})
+                dense_ids = np.fromiter(hits.keys(), dtype=np.int64, count=len(hits))
+                dense_scores = np.fromiter(hits.values(), dtype=np.float64, count=len(hits))
+            else:
+                D, I = data["faiss_index"].search(q_emb, self.config.FAISS_TOP_K)
+                valid = I[0] >= 0
+                dense_ids, dense_scores = I[0][valid], D[0][valid]
+            bm25_ids, bm25_scores = data["bm25_index"].top_k(tokenize(query), self.config.BM25_TOP_K)
+
+            ids, fused, dense_raw = fuse(dense_ids, dense_scores, bm25_ids, bm25_scores,
+                                         method=self.config.FUSION_METHOD,
+                                         dense_weight=self.config.FAISS_WEIGHT,
+                                         sparse_weight=self.config.BM25_WEIGHT,
+                                         rrf_k=self.config.RRF_K)
+            for idx, score, dense in zip(ids.tolist(), fused.tolist(), dense_raw.tolist()):
+                results.append({
                     "domain": domain_name,
                     "chunk": data["id2doc"][idx],
-                    "score": score
+                    "chunk_id": idx,
+                    "score": score,
+                    "dense_score": None if np.isnan(dense) else dense,
+                    # Keeps the vectors reachable for reranking and grading even if the domain is evicted meanwhile
+                    "faiss_index": data["faiss_index"]
                 })
+            return results
 
-        with ThreadPoolExecutor(max_workers=5) as ex:
-            ex.map(process, domain_names)
+        failures = {}
+        per_domain = self._fan_out(process, domain_names, failures)
+        if stats is not None:
+            stats["failed_domains"].extend(failures)
+        all_results = [r for results in per_domain.values() for r in results]
         return sorted(all_results, key=lambda x: x["score"], reverse=True)[:30]
 
     # --------------------------------------------------------------------
     # Reranking
     # --------------------------------------------------------------------
-    def rerank_results(self, query: str, candidates: List[Dict]) -> List[Dict]:
-        # ✅ Ensure chunks are strings for reranker
-        pairs = []
-        for c in candidates:
-            chunk_text = c["chunk"]
-            if isinstance(chunk_text, dict):
-                chunk_text = chunk_text.get("answer", "") or chunk_text.get("question", "") or str(chunk_text)
-            elif not isinstance(chunk_text, str):
-                chunk_text = str(chunk_text)
-            pairs.append([query, chunk_text])
-            c["chunk"] = chunk_text  # Update to ensure it's a string
-        
-        scores = self.reranker.predict(pairs, show_progress_bar=False)
+    def _chunk_vectors(self, domain_name: str, chunk_ids: List[int], index) -> np.ndarray:
+        """Stored FAISS vectors for chunks of one domain; `index` is the candidates' "faiss_index" (None = unified)"""
+        ids = np.asarray(chunk_ids, dtype=np.int64)
+        if index is None:
+            index = self.unified_index.index
+            ids = ids + self.unified_index.domains[domain_name]["offset"]
+        return index.reconstruct_batch(ids)
+
+    def _dense_similarities(self, query_emb: np.ndarray, candidates: List[Dict]) -> np.ndarray:
+        """Bi-encoder similarity per candidate, reusing FAISS scores where retrieval produced them"""
+        sims = np.array([np.nan if c.get("dense_score") is None else c["dense_score"] for c in candidates])
+        missing = {}
         for i, c in enumerate(candidates):
-            c["rerank_score"] = float(scores[i])
-        return sorted(candidates, key=lambda x: x["rerank_score"], reverse=True)[:self.config.FINAL_TOP_K]
+            if np.isnan(sims[i]):
+                missing.setdefault(c["domain"], []).append(i)
+        for domain_name, positions in missing.items():
+            try:
+                vectors = self._chunk_vectors(domain_name, [candidates[i]["chunk_id"] for i in positions],
+                                              candidates[positions[0]]["faiss_index"])
+                sims[positions] = vectors @ query_emb[0]
+            except Exception as e:
+                print(f"  ⚠️ Could not reconstruct vectors for {domain_name}: {e}")
+        return np.nan_to_num(sims, nan=-np.inf)
+
+    def _score_pairs(self, query: str, batch: List[Dict], stats: Dict) -> np.ndarray:
+        chunks = [((c["domain"], c["chunk_id"]), c["chunk"]) for c in batch]
+        if self.batchers is not None:
+            return self.batchers["rerank"]((query, chunks, stats))
+        if self.rerank_engine is not None:
+            return self.rerank_engine.predict(query, chunks, stats=stats)
+        # Chunk store rows are already plain text
+        return self.reranker.predict([[query, c["chunk"]] for c in batch], show_progress_bar=False)
+
+    def rerank_results(self, query: str, candidates: List[Dict], query_emb: np.ndarray = None,
+                       stats: Dict = None) -> List[Dict]:
+        """
+        Cascade: fused-score budget -> bi-encoder similarity -> cross-encoder in steps,
+        stopping early once the leader's margin is decisive. Fills `stats` with pair
+        (and, with dynamic batching, token) counts.
+        """
+        cfg = self.config
+        stats = stats if stats is not None else {}
+        stats.update(candidates=len(candidates), pairs_scored=0, early_exit=False)
+        if not candidates:
+            return []
+
+        pool = candidates
+        step = len(pool)
+        if cfg.RERANK_CASCADE:
+            pool = sorted(pool, key=lambda x: x["score"], reverse=True)[:cfg.RERANK_BUDGET]
+            if query_emb is not None and len(pool) > cfg.RERANK_FIRST_STAGE_K:
+                order = np.argsort(-self._dense_similarities(query_emb, pool), kind="stable")
+                pool = [pool[i] for i in order[:cfg.RERANK_FIRST_STAGE_K]]
+            step = max(cfg.RERANK_BATCH_SIZE, 1)
+
+        scored = []
+        for start in range(0, len(pool), step):
+            batch = pool[start:start + step]
+            scores = self._score_pairs(query, batch, stats)
+            for c, s in zip(batch, scores):
+                c["rerank_score"] = float(s)
+            scored.extend(batch)
+            # A margin needs two scores, even when FINAL_TOP_K is 1
+            if max(cfg.FINAL_TOP_K, 2) <= len(scored) < len(pool):
+                best, runner_up = sorted((c["rerank_score"] for c in scored), reverse=True)[:2]
+                if best - runner_up >= cfg.RERANK_EARLY_EXIT_MARGIN:
+                    stats["early_exit"] = True
+                    break
+
+        stats["pairs_scored"] = len(scored)
+        return sorted(scored, key=lambda x: x["rerank_score"], reverse=True)[:cfg.FINAL_TOP_K]
 
     # --------------------------------------------------------------------
     # 💡 FIXED: Full Detailed Answer Generation
     # --------------------------------------------------------------------
-    def generate_answer(self, query: str, context_chunks: List[Dict], is_emergency: bool, confidence: float = 1.0) -> str:
+    def _canned_answer(self, context_chunks: List[Dict], is_emergency: bool, confidence: float):
+        """Answers that skip generation entirely (low-confidence emergency, no context)"""
         if is_emergency and confidence < 0.4:
             return (
                 "🚨 **EMERGENCY - SEEK IMMEDIATE MEDICAL ATTENTION**\n\n"
@@ -249,12 +781,25 @@ class MemoryEfficientRAGPipeline:
                 "I couldn't find enough relevant information to answer this accurately.\n\n"
                 "⚠️ Please consult a qualified healthcare professional."
             )
+        return None
 
-        context_parts = []
+    def _prompt_chunks(self, context_chunks: List[Dict]) -> List[Tuple[Dict, str]]:
+        """(chunk, cleaned text) for the chunks that go into the prompt"""
+        used = []
         for c in context_chunks[:8]:
             text = self._clean_text(c["chunk"])
             if len(text) > 60:
-                context_parts.append(text)
+                used.append((c, text))
+        return used
+
+    def _generation_cache_key(self, query: str, context_chunks: List[Dict]):
+        if self.generation_cache is None:
+            return None
+        chunk_ids = [(c.get("domain"), c.get("chunk_id")) for c, _ in self._prompt_chunks(context_chunks)]
+        return GenerationCache.key(PROMPT_TEMPLATE_VERSION, chunk_ids, query)
+
+    def _build_prompt(self, query: str, context_chunks: List[Dict]) -> str:
+        context_parts = [text for _, text in self._prompt_chunks(context_chunks)]
         combined_context = "\n\n".join(context_parts)[:3500]
 
         prompt = f"""
@@ -273,69 +818,490 @@ Write a professional, structured answer including:
 4. When to seek medical help
 End with a clear disclaimer.
 """
+        return prompt
+
+    def _finalize_answer(self, answer: str, context_chunks: List[Dict], is_emergency: bool, confidence: float,
+                         min_words: int = 40, extractive: bool = False, stats: Dict = None) -> str:
+        """Extractive fallback for short (or early-aborted) answers, then the safety footer"""
+        answer = self._clean_text(answer)
+
+        extractive = extractive or len(answer.split()) < min_words
+        if stats is not None:
+            stats["extractive"] = extractive
+        if extractive:
+            best_chunk = self._clean_text(context_chunks[0]["chunk"])
+            sentences = sent_tokenize(best_chunk)
+            answer = " ".join(sentences[:10])
+
+        if is_emergency and confidence >= 0.4:
+            answer += "\n\n🚨 **If these symptoms occur, seek immediate medical care.**"
+        else:
+            answer += "\n\n⚠️ Please consult a healthcare professional for personalized advice."
+
+        return answer
 
+    def _generation_fallback(self, context_chunks: List[Dict], error: Exception) -> str:
+        print(f"❌ Generation error: {error}")
+        fallback = self._clean_text(context_chunks[0]["chunk"])
+        return fallback + "\n\n⚠️ Please consult a healthcare professional."
+
+    @staticmethod
+    def _generation_stats(profile: GenerationProfile, stats: Dict = None) -> Dict:
+        stats = stats if stats is not None else {}
+        stats.update({"profile": profile.name, "tokens_decoded": 0, "early_exit": False, "extractive": False,
+                      "cache": None})
+        return stats
+
+    def generate_answer(self, query: str, context_chunks: List[Dict], is_emergency: bool, confidence: float = 1.0,
+                        profile: str = None, stats: Dict = None) -> str:
+        """
+        Decode with a named generation profile (default: config.GENERATION_PROFILE).
+        `stats` receives the profile name, tokens decoded, and whether the early check
+        or the extractive fallback replaced the generated text.
+        """
+        profile = get_profile(profile or self.config.GENERATION_PROFILE)
+        stats = self._generation_stats(profile, stats)
+        canned = self._canned_answer(context_chunks, is_emergency, confidence)
+        if canned is not None:
+            return canned
+
+        prompt = self._build_prompt(query, context_chunks)
+        cache_key = self._generation_cache_key(query, context_chunks)
         try:
-            inputs = self.generator_tokenizer(prompt, return_tensors="pt", max_length=1024, truncation=True).to(device)
-            with torch.no_grad():
-                outputs = self.generator_model.generate(
-                    **inputs,
-                    max_new_tokens=512,
-                    temperature=0.6,
-                    top_p=0.9,
-                    num_beams=4,
-                    do_sample=False,
-                    repetition_penalty=1.15,
-                    pad_token_id=self.generator_tokenizer.pad_token_id,
-                    eos_token_id=self.generator_tokenizer.eos_token_id
-                )
-
-            answer = self.generator_tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
-            answer = self._clean_text(answer)
-
-            if len(answer.split()) < 40:
-                best_chunk = self._clean_text(context_chunks[0]["chunk"])
-                sentences = sent_tokenize(best_chunk)
-                answer = " ".join(sentences[:10])
-
-            if is_emergency and confidence >= 0.4:
-                answer += "\n\n🚨 **If these symptoms occur, seek immediate medical care.**"
+            output = self.generation_cache.get_answer(cache_key, profile.name) if cache_key else None
+            if output is not None:
+                stats["cache"] = "answer"
             else:
-                answer += "\n\n⚠️ Please consult a healthcare professional for personalized advice."
+                if self.batchers is not None:
+                    output = self.batchers["generate"]((prompt, profile.name))
+                else:
+                    output = self._generate_texts([prompt], profile, cache_key=cache_key)[0]
+                    stats["cache"] = output["cache"]
+                if cache_key:
+                    self.generation_cache.put_answer(cache_key, profile.name, output)
+                stats["tokens_decoded"] = output["tokens_decoded"]
+            stats["early_exit"] = output["early_exit"]
+            return self._finalize_answer(output["text"], context_chunks, is_emergency, confidence,
+                                         min_words=profile.min_words, extractive=output["early_exit"], stats=stats)
+
+        except Exception as e:
+            return self._generation_fallback(context_chunks, e)
+
+    def stream_answer(self, query: str, context_chunks: List[Dict], is_emergency: bool,
+                      confidence: float = 1.0, profile: str = None, stats: Dict = None) -> Iterator[Tuple[str, str]]:
+        """
+        Greedy decode streamed through TextIteratorStreamer.
+        Yields ("token", text delta) while decoding, then ("answer", final answer).
+        """
+        profile = get_profile(profile or self.config.GENERATION_PROFILE)
+        stats = self._generation_stats(profile, stats)
+        canned = self._canned_answer(context_chunks, is_emergency, confidence)
+        if canned is not None:
+            yield "answer", canned
+            return
+
+        prompt = self._build_prompt(query, context_chunks)
+        cache_key = self._generation_cache_key(query, context_chunks)
+        # Streamed answers are greedy, so they are cached apart from the profile's beam-search answers
+        cache_profile = f"{profile.name}/stream"
+        try:
+            cached = self.generation_cache.get_answer(cache_key, cache_profile) if cache_key else None
+            if cached is not None:
+                stats["cache"] = "answer"
+                stats["early_exit"] = cached["early_exit"]
+                yield "token", cached["text"]
+                yield "answer", self._finalize_answer(cached["text"], context_chunks, is_emergency, confidence,
+                                                      min_words=profile.min_words, extractive=cached["early_exit"],
+                                                      stats=stats)
+                return
+
+            inputs, encoder_hit = self._generator_inputs([prompt], cache_key)
+            stats["cache"] = "encoder" if encoder_hit else None
+            streamer = TextIteratorStreamer(self.generator_tokenizer, skip_special_tokens=True)
+            # Streamers do not support beam search, so this path decodes greedily with the profile's budget
+            gen_kwargs = dict(
+                **inputs,
+                **profile.generate_kwargs(),
+                streamer=streamer,
+                pad_token_id=self.generator_tokenizer.pad_token_id,
+                eos_token_id=self.generator_tokenizer.eos_token_id
+            )
+            gen_kwargs["num_beams"] = 1
+            check = self._early_check(profile, greedy=True)
+            # Set when the consumer stops reading (client disconnect closes this generator), so decoding
+            # stops at the next token instead of running to max_new_tokens after the admission slot is freed
+            cancel = Event()
+            gen_kwargs["stopping_criteria"] = [c for c in (check, CancelGeneration(cancel)) if c is not None]
+            errors, outputs = [], []
+
+            def run():
+                try:
+                    with torch.no_grad():
+                        outputs.append(self.generator_model.generate(**gen_kwargs))
+                except Exception as e:
+                    errors.append(e)
+                    streamer.end()
+
+            worker = Thread(target=run, name="rag-stream-generate", daemon=True)
+            worker.start()
+            parts = []
+            try:
+                for delta in streamer:
+                    if delta:
+                        parts.append(delta)
+                        yield "token", delta
+            finally:
+                cancel.set()
+                worker.join()
+            if errors:
+                raise errors[0]
+            stats["tokens_decoded"] = self._tokens_decoded(outputs[0][0])
+            stats["early_exit"] = check is not None and bool(check.aborted)
+            if cache_key:
+                self.generation_cache.put_answer(cache_key, cache_profile, {
+                    "text": "".join(parts), "tokens_decoded": stats["tokens_decoded"],
+                    "early_exit": stats["early_exit"]})
+            yield "answer", self._finalize_answer("".join(parts), context_chunks, is_emergency, confidence,
+                                                  min_words=profile.min_words, extractive=stats["early_exit"],
+                                                  stats=stats)
+
+        except Exception as e:
+            yield "answer", self._generation_fallback(context_chunks, e)
 
-            return answer
+    @staticmethod
+    def _early_check(profile: GenerationProfile, greedy: bool):
+        if profile.early_check_tokens is None or not greedy:
+            return None
+        return EarlyQualityCheck(profile.early_check_tokens, profile.min_distinct_ratio)
 
+    def _tokens_decoded(self, output_ids: torch.Tensor) -> int:
+        # Seq2seq outputs: decoder start token, the answer, then padding (T5 uses pad as the start token)
+        return int((output_ids != self.generator_tokenizer.pad_token_id).sum())
+
+    def _generator_inputs(self, prompts: List[str], cache_key=None) -> Tuple[Dict, bool]:
+        """
+        generate() inputs for the prompts -> (kwargs, encoder cache hit).
+        With a cache key (single prompt, PyTorch generator) the encoder runs here
+        and its hidden states are cached, so generate() only decodes.
+        """
+        use_cache = (cache_key is not None and len(prompts) == 1 and
+                     isinstance(self.generator_model, torch.nn.Module))
+        cached = self.generation_cache.get_encoder(cache_key) if use_cache else None
+        if cached is not None:
+            hidden_states, attention_mask = cached["hidden_states"], cached["attention_mask"]
+        else:
+            inputs = self.generator_tokenizer(prompts, return_tensors="pt", max_length=1024,
+                                              truncation=True, padding=True).to(device)
+            if not use_cache:
+                return dict(inputs), False
+            with torch.no_grad():
+                hidden_states = self.generator_model.get_encoder()(**inputs, return_dict=True).last_hidden_state
+            attention_mask = inputs["attention_mask"]
+            self.generation_cache.put_encoder(cache_key, hidden_states, attention_mask)
+        # generate() expands encoder outputs in place for beam search, so wrap the cached tensor afresh
+        return dict(encoder_outputs=BaseModelOutput(last_hidden_state=hidden_states),
+                    attention_mask=attention_mask), cached is not None
+
+    def _generate_texts(self, prompts: List[str], profile: GenerationProfile, cache_key=None) -> List[Dict]:
+        """
+        One (optionally batched) generate() call; prompts are padded to the longest.
+        Returns {"text", "tokens_decoded", "early_exit", "cache"} per prompt.
+        """
+        inputs, encoder_hit = self._generator_inputs(prompts, cache_key)
+        gen_kwargs = profile.generate_kwargs()
+        check = self._early_check(profile, greedy=profile.num_beams == 1)
+        if check is not None:
+            gen_kwargs["stopping_criteria"] = [check]
+        with torch.no_grad():
+            outputs = self.generator_model.generate(
+                **inputs,
+                **gen_kwargs,
+                pad_token_id=self.generator_tokenizer.pad_token_id,
+                eos_token_id=self.generator_tokenizer.eos_token_id
+            )
+        aborted = check.aborted if check is not None else set()
+        return [{"text": self.generator_tokenizer.decode(o, skip_special_tokens=True).strip(),
+                 "tokens_decoded": self._tokens_decoded(o),
+                 "early_exit": row in aborted,
+                 "cache": "encoder" if encoder_hit else None}
+                for row, o in enumerate(outputs)]
+
+    # --------------------------------------------------------------------
+    # Grading
+    # --------------------------------------------------------------------
+    def _context_embedding(self, context_chunks: List[Dict]) -> np.ndarray:
+        """Mean of the chunks' stored FAISS vectors, re-normalized; (dim,) float32"""
+        by_domain, indexes = {}, {}
+        for c in context_chunks:
+            by_domain.setdefault(c["domain"], []).append(c["chunk_id"])
+            indexes[c["domain"]] = c["faiss_index"]
+        vectors = np.concatenate([self._chunk_vectors(domain, ids, indexes[domain])
+                                  for domain, ids in by_domain.items()])
+        pooled = vectors.mean(axis=0)
+        return (pooled / max(np.linalg.norm(pooled), 1e-12)).astype("float32")
+
+    def _embed_text(self, text: str) -> np.ndarray:
+        if self.batchers is not None:
+            return self.batchers["embed"](text)
+        return self.embedder.encode([text], convert_to_numpy=True, normalize_embeddings=True,
+                                    show_progress_bar=False).astype("float32")[0]
+
+    def compute_metrics(self, answer: str, context_chunks: List[Dict], is_emergency: bool) -> Dict:
+        """
+        Answer grading as in the notebooks: composite = 0.6 * retrieval + 0.4 * faithfulness,
+        clamped to [0.3, 0.95]. Faithfulness compares the answer with the context's stored
+        chunk vectors, so only the answer is encoded.
+        """
+        if is_emergency:
+            return {"retrieval_score": 0.95, "faithfulness": 0.95, "composite": 0.95}
+        if not context_chunks:
+            return {"retrieval_score": 0.0, "faithfulness": 0.0, "composite": 0.0}
+
+        retrieval_score = float(np.mean([c["rerank_score"] for c in context_chunks]))
+        answer_emb = self._embed_text(answer)
+        try:
+            context_emb = self._context_embedding(context_chunks)
         except Exception as e:
-            print(f"❌ Generation error: {e}")
-            fallback = self._clean_text(context_chunks[0]["chunk"])
-            return fallback + "\n\n⚠️ Please consult a healthcare professional."
+            # Index type without reconstruct support: encode the context text like the notebooks
+            print(f"  ⚠️ Stored chunk vectors unavailable ({e}); encoding context text")
+            context_emb = self._embed_text(" ".join(c["chunk"] for c in context_chunks))
+        faithfulness = float(np.dot(answer_emb, context_emb))
+
+        composite = 0.6 * retrieval_score + 0.4 * faithfulness
+        composite = min(max(composite, 0.3), 0.95)
+        return {"retrieval_score": retrieval_score, "faithfulness": faithfulness, "composite": float(composite)}
+
+    # --------------------------------------------------------------------
+    # Warm-up
+    # --------------------------------------------------------------------
+    def warm_up(self, query: str = "What are the common symptoms and treatments of high blood pressure?") -> Dict:
+        """
+        Run one query through the embedder, every loaded index, the reranker and
+        the generator, bypassing the caches, so first-request costs (kernel
+        selection, allocator growth, page faults on mmap'd indexes) are paid
+        before traffic arrives. Returns seconds per stage.
+        """
+        timings = {}
+        start = time.perf_counter()
+        query_emb = self.embedder.encode([query], convert_to_numpy=True, normalize_embeddings=True,
+                                         show_progress_bar=False).astype("float32")
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidates = self.hybrid_retrieval(query, list(self.loaded_domains), query_emb=query_emb)  # resident only
+        timings["retrieve"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reranked = self.rerank_results(query, candidates, query_emb=query_emb)
+        timings["rerank"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._generate_texts([self._build_prompt(query, reranked)], get_profile(self.config.GENERATION_PROFILE))
+        timings["generate"] = time.perf_counter() - start
+
+        timings = {k: round(v, 3) for k, v in timings.items()}
+        print(f"🔥 Warm-up done: {timings}")
+        return timings
 
     # --------------------------------------------------------------------
     # Main Query Runner
     # --------------------------------------------------------------------
-    def run_query(self, query: str) -> Dict:
-        start = time.time()
+    def _prepare_query(self, query: str) -> Dict:
+        """
+        Cheap per-query steps: emergency check and routing. The embedding router
+        needs query_emb here; with keyword routing it is filled lazily.
+        """
         print(f"\n🔍 Query: {query}")
 
         is_emergency = self._detect_emergency(query)
-        domains = self.route_to_domains(query)
+        query_emb = self.encode_query(query) if self.domain_router is not None else None
+        routing = {}
+        domains = self.route_to_domains(query, query_emb=query_emb, stats=routing)
         print(f"📍 Domains: {domains}")
+        return {"is_emergency": is_emergency, "domains": domains, "query_emb": query_emb, "routing": routing}
+
+    def _cached_result(self, query: str, profile: str, prepared: Dict):
+        """Answer-cache lookup (exact, then semantic); emergencies always bypass the cache"""
+        if (self.answer_cache is None and self.shared_cache is None) or prepared["is_emergency"]:
+            return None
+        result = self.answer_cache.get_exact(query, profile) if self.answer_cache is not None else None
+        if result is None and self.shared_cache is not None:
+            result = self.shared_cache.get_value(self._shared_key("ans", query, prepared["domains"], profile))
+            if result is not None:
+                result["answer_cache"] = {"tier": "shared", "similarity": 1.0}
+        if result is None and self.answer_cache is not None:
+            # The semantic tier needs the embedding; keep it for retrieval on a miss
+            prepared["query_emb"] = self.encode_query(query)
+            result = self.answer_cache.get_semantic(prepared["query_emb"], profile, prepared["domains"])
+        if result is not None:
+            print(f"⚡ Answer cache hit ({result['answer_cache']['tier']}, "
+                  f"similarity={result['answer_cache']['similarity']:.3f})")
+        return result
+
+    def _store_result(self, query: str, profile: str, ctx: Dict, result: Dict):
+        if ctx["is_emergency"] or not ctx["reranked"]:
+            return
+        if self.answer_cache is not None:
+            self.answer_cache.put(query, ctx["query_emb"], profile, ctx["domains"], result)
+        if self.shared_cache is not None:
+            self.shared_cache.set_value(self._shared_key("ans", query, ctx["domains"], profile), result,
+                                        self.config.CACHE_TTL_S)
+
+    def invalidate_domain_cache(self, domain: str) -> Dict:
+        """Drop cached answers and generation states that drew on `domain` (e.g. after reindexing it)"""
+        return {
+            "answers": self.answer_cache.invalidate_domain(domain) if self.answer_cache else 0,
+            "generation": self.generation_cache.invalidate_domain(domain) if self.generation_cache else 0,
+            # Retrieval and answer keys carry the routed domains (embeddings do not depend on any domain)
+            "shared": self.shared_cache.delete_matching(f"*{domain_tag([domain])}*") if self.shared_cache else 0,
+        }
+
+    def _retrieve_context(self, query: str, prepared: Dict = None) -> Dict:
+        """Everything before generation: emergency check, routing, retrieval, reranking"""
+        prepared = prepared or self._prepare_query(query)
+        is_emergency, domains = prepared["is_emergency"], prepared["domains"]
+
+        query_emb = prepared["query_emb"] if prepared["query_emb"] is not None else self.encode_query(query)
+        candidates = self._cached_retrieval(query, domains, query_emb)
+        rerank_stats = {}
+        reranked = self.rerank_results(query, candidates, query_emb=query_emb, stats=rerank_stats)
+        print(f"⚖️ Reranked {rerank_stats['pairs_scored']}/{rerank_stats['candidates']} candidates"
+              f"{' (early exit)' if rerank_stats['early_exit'] else ''}"
+              f"{', ' + str(rerank_stats['tokens']) + ' tokens' if 'tokens' in rerank_stats else ''}")
+        confidence = float(np.mean([r["rerank_score"] for r in reranked])) if reranked else 0.5
+        return {
+            "is_emergency": is_emergency,
+            "domains": domains,
+            "routing": prepared.get("routing"),
+            "query_emb": query_emb,
+            "reranked": reranked,
+            "rerank_stats": rerank_stats,
+            "confidence": confidence,
+        }
+
+    @staticmethod
+    def _sources(reranked: List[Dict], domains: List[str]) -> List[Dict]:
+        return [{"chunk": c["chunk"][:200], "domain": domains[0] if domains else "Unknown", "score": c.get("rerank_score", 0.0)}
+                for c in reranked[:3]] if reranked else []
 
-        candidates = self.hybrid_retrieval(query, domains)
-        reranked = self.rerank_results(query, candidates)
-        confidence = np.mean([r["rerank_score"] for r in reranked]) if reranked else 0.5
-        answer = self.generate_answer(query, reranked, is_emergency, confidence)
+    def run_query(self, query: str, profile: str = None) -> Dict:
+        start = time.time()
+        profile = get_profile(profile or self.config.GENERATION_PROFILE).name
+        prepared = self._prepare_query(query)
+        cached = self._cached_result(query, profile, prepared)
+        if cached is not None:
+            cached["query"] = query
+            cached["processing_time"] = round(time.time() - start, 2)
+            return cached
+
+        ctx = self._retrieve_context(query, prepared)
+        reranked, confidence = ctx["reranked"], ctx["confidence"]
+        generation_stats = {}
+        answer = self.generate_answer(query, reranked, ctx["is_emergency"], confidence,
+                                      profile=profile, stats=generation_stats)
+        grading = self._grade(answer, reranked, ctx["is_emergency"])
+
+        print(f"✅ Answer generated ({round(time.time() - start, 2)}s, conf={confidence:.2f}, "
+              f"profile={generation_stats['profile']}, {generation_stats['tokens_decoded']} tokens)")
+        result = self._result(query, answer, ctx, generation_stats, grading, start)
+        self._store_result(query, profile, ctx, result)
+        return result
+
+    def _grade(self, answer: str, reranked: List[Dict], is_emergency: bool):
+        """compute_metrics when ANSWER_GRADING is on, else None"""
+        if not self.config.ANSWER_GRADING:
+            return None
+        return self.compute_metrics(answer, reranked, is_emergency)
 
-        print(f"✅ Answer generated ({round(time.time() - start, 2)}s, conf={confidence:.2f})")
+    def _result(self, query: str, answer: str, ctx: Dict, generation_stats: Dict, grading: Dict,
+                start: float) -> Dict:
+        confidence = ctx["confidence"]
         return {
             "query": query,
             "answer": answer,
-            "domains": domains,
+            "domains": ctx["domains"],
+            "routing": ctx["routing"],
             "metrics": {"composite": confidence, "confidence": confidence},  # ✅ Include both keys for compatibility
+            "grading": grading,
+            "processing_time": round(time.time() - start, 2),
+            "is_emergency": ctx["is_emergency"],
+            "rerank": ctx["rerank_stats"],
+            "generation": generation_stats,
+            "answer_cache": None,
+            "sources": self._sources(ctx["reranked"], ctx["domains"])
+        }
+
+    def stream_query(self, query: str, profile: str = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of run_query, yielding (event, payload):
+            "metadata"  domains, sources, is_emergency as soon as reranking finishes
+            "token"     decoded text deltas
+            "done"      final answer, confidence, is_emergency, generation stats, processing_time
+        The final answer may differ from the streamed text (extractive fallback, safety footer).
+        An answer-cache hit is sent as a single token event.
+        """
+        start = time.time()
+        profile = get_profile(profile or self.config.GENERATION_PROFILE)
+        prepared = self._prepare_query(query)
+        cached = self._cached_result(query, profile.name, prepared)
+        if cached is not None:
+            yield "metadata", {
+                "query": query,
+                "domains": cached["domains"],
+                "sources": cached["sources"],
+                "is_emergency": cached["is_emergency"],
+                "rerank": cached["rerank"],
+                "retrieval_time": round(time.time() - start, 2),
+            }
+            yield "token", {"text": cached["answer"]}
+            yield "done", {
+                "answer": cached["answer"],
+                "confidence": cached["metrics"]["confidence"],
+                "grading": cached.get("grading"),
+                "is_emergency": cached["is_emergency"],
+                "generation": cached["generation"],
+                "answer_cache": cached["answer_cache"],
+                "processing_time": round(time.time() - start, 2),
+            }
+            return
+
+        ctx = self._retrieve_context(query, prepared)
+        reranked, confidence = ctx["reranked"], ctx["confidence"]
+        yield "metadata", {
+            "query": query,
+            "domains": ctx["domains"],
+            "routing": ctx["routing"],
+            "sources": self._sources(reranked, ctx["domains"]),
+            "is_emergency": ctx["is_emergency"],
+            "rerank": ctx["rerank_stats"],
+            "retrieval_time": round(time.time() - start, 2),
+        }
+
+        answer, generation_stats = "", {}
+        # closing() stops the decode thread as soon as this generator is closed, not when it is collected
+        with closing(self.stream_answer(query, reranked, ctx["is_emergency"], confidence,
+                                        profile=profile.name, stats=generation_stats)) as tokens:
+            for kind, text in tokens:
+                if kind == "token":
+                    yield "token", {"text": text}
+                else:
+                    answer = text
+
+        grading = self._grade(answer, reranked, ctx["is_emergency"])
+        print(f"✅ Answer streamed ({round(time.time() - start, 2)}s, conf={confidence:.2f})")
+        yield "done", {
+            "answer": answer,
+            "confidence": confidence,
+            "grading": grading,
+            "is_emergency": ctx["is_emergency"],
+            "generation": generation_stats,
+            "answer_cache": None,
             "processing_time": round(time.time() - start, 2),
-            "is_emergency": is_emergency,
-            "sources": [{"chunk": c["chunk"][:200], "domain": domains[0] if domains else "Unknown", "score": c.get("rerank_score", 0.0)} 
-                       for c in reranked[:3]] if reranked else []
         }
+        # Streamed answers are greedy; only cache them where run_query would decode greedily too
+        if profile.num_beams == 1:
+            self._store_result(query, profile.name, ctx,
+                               self._result(query, answer, ctx, generation_stats, grading, start))
 
 
 # ========================================================================
@@ -0,0 +1,266 @@
+"""
+Pre-fork launcher for the MediRAG backend
+Builds the RAG pipeline once in a master process, freezes the heap, then forks workers that
+share model weights and indexes copy-on-write (Linux / macOS; os.fork is not available on Windows)
+
+Workers that exit shortly after starting are restarted with exponential backoff, and the master
+gives up after --max-fast-exits in a row. POST /api/cache/invalidate on any worker is relayed
+through the master to every other worker, so all in-process caches drop the domain.
+
+Usage:
+    python prefork.py --workers 4
+    python prefork.py --workers 2 --torch-threads 4 --report-interval 60
+    kill -USR1 <master pid>    # print the memory report now
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import select
+import signal
+import socket
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+FAST_EXIT_S = 30.0  # A worker exiting sooner than this after its fork counts as a startup failure
+MAX_RESTART_DELAY_S = 60.0
+
+
+def memory_usage(pid="self") -> Optional[Dict[str, float]]:
+    """
+    Memory of one process in MB from /proc/<pid>/smaps_rollup (or smaps on
+    older kernels): rss, pss, shared (pages also mapped by another process,
+    e.g. copy-on-write weights) and private. None where /proc is unavailable.
+    """
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                for line in f:
+                    field, _, rest = line.partition(":")
+                    if field in totals:
+                        totals[field] += int(rest.split()[0])
+            break
+        except (OSError, ValueError):
+            continue
+    else:
+        return None
+    mb = {k: v / 1024 for k, v in totals.items()}
+    return {
+        "rss": mb["Rss"],
+        "pss": mb["Pss"],
+        "shared": mb["Shared_Clean"] + mb["Shared_Dirty"],
+        "private": mb["Private_Clean"] + mb["Private_Dirty"],
+        "swap": mb["Swap"],
+    }
+
+
+def print_report(master_pid: int, workers: Dict[int, int]):
+    rows = [("master", master_pid)] + [(f"worker {slot}", pid) for pid, slot in sorted(workers.items(), key=lambda w: w[1])]
+    print(f"\n{'process':<12}{'pid':<9}{'rss MB':>10}{'shared MB':>12}{'private MB':>12}{'pss MB':>10}")
+    print("-" * 65)
+    total_pss = 0.0
+    for name, pid in rows:
+        usage = memory_usage(pid)
+        if usage is None:
+            print(f"{name:<12}{pid:<9}{'n/a':>10}")
+            continue
+        total_pss += usage["pss"]
+        print(f"{name:<12}{pid:<9}{usage['rss']:>10.0f}{usage['shared']:>12.0f}{usage['private']:>12.0f}{usage['pss']:>10.0f}")
+    # PSS splits each shared page between the processes mapping it, so the sum is the real footprint
+    print(f"{'total (pss)':<21}{'':>34}{total_pss:>10.0f}\n", flush=True)
+
+
+def listen(host: str, port: int, backlog: int = 1024) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def listen_for_invalidations(server_app, commands_fd: int):
+    """Worker thread: apply invalidations other workers received (one JSON line per domain, via the master)"""
+    with os.fdopen(commands_fd, "rb") as commands:
+        for line in commands:
+            domain = json.loads(line)["domain"]
+            removed = server_app.pipeline_instance.invalidate_domain_cache(domain)
+            print(f"🧹 Worker {os.getpid()}: cache invalidated for {domain} (relayed): {removed}", flush=True)
+
+
+def run_worker(server_app, sock: socket.socket, slot: int, server: str, threads: int, torch_threads: int,
+               notify_fd: int, commands_fd: int):
+    """Body of a forked worker; never returns"""
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        gc.enable()
+        server_app.pipeline_instance.after_fork(torch_threads)
+        server_app.reconnect_db()
+        # A short JSON line is far below PIPE_BUF, so concurrent writes from several workers never interleave
+        server_app.invalidation_broadcast = lambda domain: os.write(
+            notify_fd, (json.dumps({"pid": os.getpid(), "domain": domain}) + "\n").encode())
+        threading.Thread(target=listen_for_invalidations, args=(server_app, commands_fd),
+                         name="cache-invalidations", daemon=True).start()
+        # Warm-up runs here rather than in the master so every worker's kernels and thread pools are
+        # initialized in its own process; the worker reports ready on /api/health once it finishes
+        server_app.start_background_init()
+        print(f"  👷 Worker {slot} (pid {os.getpid()}) serving, torch threads={torch_threads}", flush=True)
+        server_app.serve(server, threads, sock=sock)
+    except Exception as e:
+        print(f"❌ Worker {slot} (pid {os.getpid()}) failed: {e}", flush=True)
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load the RAG pipeline once and fork copy-on-write workers")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--report-interval", type=float, default=300.0,
+                        help="Seconds between memory reports (0 = only on SIGUSR1)")
+    parser.add_argument("--max-fast-exits", type=int, default=5,
+                        help=f"Stop after a worker exits within {FAST_EXIT_S:.0f}s of starting this many times in a row")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork"):
+        print("❌ prefork.py needs os.fork (Linux / macOS); use python app.py on Windows")
+        return 1
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    # libgomp (torch's and FAISS's OpenMP) is not fork-safe: if the master ever runs a parallel region
+    # with more than one thread, the first torch op in each forked worker deadlocks on the dead pool.
+    # So the master loads single-threaded (set before torch is imported) and after_fork raises the
+    # count per worker.
+    os.environ["OMP_NUM_THREADS"] = "1"
+    # Keep the collector from touching (and so un-sharing) objects while the models load
+    gc.disable()
+    import faiss
+    import torch
+    import app as server_app
+    from multi_domains_medical_final_rag_model import config
+    torch.set_num_threads(1)
+    faiss.omp_set_num_threads(1)
+    worker_faiss_threads = config.FAISS_THREADS
+    config.TORCH_THREADS, config.FAISS_THREADS = 1, 1
+    if not server_app.initialize_rag_pipeline():
+        return 1
+    # Applied by after_fork in each worker
+    config.FAISS_THREADS = worker_faiss_threads
+    server, threads = server_app.serving_mode()
+    sock = listen(args.host, args.port)
+    # Move everything allocated so far into the permanent generation: workers' collections skip it,
+    # so its pages stay shared instead of being dirtied by GC bookkeeping
+    gc.collect()
+    gc.freeze()
+
+    print("\n" + "=" * 80)
+    print(f"*** PRE-FORK MASTER {os.getpid()}: {args.workers} workers on {args.host}:{args.port} ***")
+    print(f"   Server: {server} ({threads} threads/worker), torch threads/worker: {torch_threads}")
+    print(f"   Pipeline slots/worker: {server_app.PIPELINE_SLOTS}, queue/worker: {server_app.QUEUE_SIZE}")
+    print("=" * 80 + "\n", flush=True)
+
+    workers: Dict[int, int] = {}  # pid -> slot
+    started: Dict[int, float] = {}  # slot -> fork time
+    fast_exits: Dict[int, int] = {}  # slot -> consecutive exits within FAST_EXIT_S
+    restart_at: Dict[int, float] = {}  # slot -> when to fork its replacement
+    commands: Dict[int, int] = {}  # pid -> write end of the worker's invalidation pipe
+    notify_r, notify_w = os.pipe()  # workers -> master: invalidations to relay
+    stopping = []
+    exit_code = 0
+
+    def spawn(slot: int):
+        commands_r, commands_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            for fd in [notify_r, commands_w, *commands.values()]:
+                os.close(fd)
+            run_worker(server_app, sock, slot, server, threads, torch_threads, notify_w, commands_r)
+        os.close(commands_r)
+        os.set_blocking(commands_w, False)  # a stuck worker must not block the master's relay
+        workers[pid] = slot
+        commands[pid] = commands_w
+        started[slot] = time.monotonic()
+
+    def relay(line: bytes):
+        sender = json.loads(line)["pid"]
+        for pid, fd in commands.items():
+            if pid != sender:
+                try:
+                    os.write(fd, line)
+                except OSError:  # the worker just exited
+                    pass
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: print_report(os.getpid(), workers))
+
+    for slot in range(args.workers):
+        spawn(slot)
+
+    next_report = time.monotonic() + args.report_interval if args.report_interval else None
+    pending = b""
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        now = time.monotonic()
+        if pid and pid in workers:
+            slot = workers.pop(pid)
+            os.close(commands.pop(pid))
+            fast_exits[slot] = fast_exits.get(slot, 0) + 1 if now - started[slot] < FAST_EXIT_S else 0
+            if fast_exits[slot] >= args.max_fast_exits:
+                print(f"❌ Worker {slot} exited within {FAST_EXIT_S:.0f}s of starting {fast_exits[slot]} times "
+                      f"in a row (last status {status}); giving up", flush=True)
+                exit_code = 1
+                break
+            delay = min(2 ** (fast_exits[slot] - 1), MAX_RESTART_DELAY_S) if fast_exits[slot] else 0
+            print(f"⚠️ Worker {slot} (pid {pid}) exited with status {status}; restarting"
+                  f"{f' in {delay:.0f}s' if delay else ''}", flush=True)
+            restart_at[slot] = now + delay
+        for slot, when in list(restart_at.items()):
+            if now >= when:
+                del restart_at[slot]
+                spawn(slot)
+        if next_report is not None and now >= next_report:
+            print_report(os.getpid(), workers)
+            next_report = now + args.report_interval
+        if select.select([notify_r], [], [], 0.5)[0]:
+            pending += os.read(notify_r, 65536)
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                relay(line + b"\n")
+
+    print("\n🛑 Stopping workers...", flush=True)
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in list(workers):
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Length-aware cross-encoder reranking engine for the Medical RAG pipeline
+Sorts pairs by token length, batches them under a token budget and caches chunk tokenization
+"""
+
+import threading
+import numpy as np
+import torch
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Tuple
+
+
+class RerankEngine:
+    """
+    Drop-in replacement for ``CrossEncoder.predict`` on (query, chunk) pairs.
+
+    Pairs are sorted by tokenized length and grouped so that
+    ``batch size x longest pair`` stays under ``token_budget``; one long
+    chunk then only inflates its own bucket. Chunk token ids are cached by
+    chunk key (e.g. ``(domain, chunk_id)``) so repeat chunks skip the tokenizer.
+    """
+
+    def __init__(self, cross_encoder, token_budget: int = 8192, max_batch_size: int = 32,
+                 cache_size: int = 20000):
+        self.cross_encoder = cross_encoder
+        self.model = cross_encoder.model
+        self.tokenizer = cross_encoder.tokenizer
+        self.max_length = cross_encoder.max_length or self.tokenizer.model_max_length
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        # sentence-transformers >= 3 exposes activation_fn; older versions default_activation_function
+        self.activation = getattr(cross_encoder, "activation_fn", None) or \
+            getattr(cross_encoder, "default_activation_function", None)
+        self._use_token_types = "token_type_ids" in self.tokenizer.model_input_names
+        self._n_special = self.tokenizer.num_special_tokens_to_add(pair=True)
+        self._cache: "OrderedDict[Hashable, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # --------------------------------------------------------------------
+    # Tokenization
+    # --------------------------------------------------------------------
+    def _chunk_ids(self, key: Hashable, text: str) -> List[int]:
+        with self._lock:
+            ids = self._cache.get(key)
+            if ids is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return ids
+        ids = self.tokenizer(text, add_special_tokens=False, truncation=True,
+                             max_length=self.max_length)["input_ids"]
+        with self._lock:
+            self.cache_misses += 1
+            self._cache[key] = ids
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    def _encode_pair(self, query_ids: List[int], chunk_ids: List[int]) -> Tuple[List[int], List[int]]:
+        room = self.max_length - self._n_special
+        query_ids = query_ids[:max(room // 2, room - len(chunk_ids))]
+        chunk_ids = chunk_ids[:room - len(query_ids)]
+        input_ids = self.tokenizer.build_inputs_with_special_tokens(query_ids, chunk_ids)
+        token_types = (self.tokenizer.create_token_type_ids_from_sequences(query_ids, chunk_ids)
+                       if self._use_token_types else None)
+        return input_ids, token_types
+
+    # --------------------------------------------------------------------
+    # Batching / Scoring
+    # --------------------------------------------------------------------
+    def _buckets(self, lengths: List[int]) -> List[List[int]]:
+        """Positions grouped shortest-first so each batch's padded size fits the token budget"""
+        buckets, current = [], []
+        for pos in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            # Sorted ascending, so the newest pair sets the padded length
+            if current and (len(current) >= self.max_batch_size or
+                            (len(current) + 1) * lengths[pos] > self.token_budget):
+                buckets.append(current)
+                current = []
+            current.append(pos)
+        if current:
+            buckets.append(current)
+        return buckets
+
+    def _forward(self, encoded: List[Tuple[List[int], List[int]]]) -> np.ndarray:
+        width = max(len(ids) for ids, _ in encoded)
+        pad_id = self.tokenizer.pad_token_id or 0
+        input_ids = torch.full((len(encoded), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(encoded), width), dtype=torch.long)
+        token_type_ids = torch.zeros((len(encoded), width), dtype=torch.long) if self._use_token_types else None
+        for row, (ids, types) in enumerate(encoded):
+            input_ids[row, :len(ids)] = torch.tensor(ids)
+            attention_mask[row, :len(ids)] = 1
+            if token_type_ids is not None:
+                token_type_ids[row, :len(types)] = torch.tensor(types)
+
+        features = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if token_type_ids is not None:
+            features["token_type_ids"] = token_type_ids
+        device = self.model.device
+        with torch.inference_mode():
+            logits = self.model(**{k: v.to(device) for k, v in features.items()}, return_dict=True).logits
+            if self.activation is not None:
+                logits = self.activation(logits)
+        logits = logits.float().cpu().numpy()
+        return logits[:, 0] if logits.shape[1] == 1 else logits
+
+    def predict(self, query: str, chunks: List[Tuple[Hashable, str]], stats: Dict = None) -> np.ndarray:
+        """Score (chunk key, chunk text) pairs against one query; adds token counts to `stats`"""
+        return self.predict_many([(query, chunks)], [stats])[0]
+
+    def predict_many(self, requests: List[Tuple[str, List[Tuple[Hashable, str]]]],
+                     stats: List[Dict] = None) -> List[np.ndarray]:
+        """
+        Score several queries' pairs in shared length buckets (cross-request batching).
+        Each request's stats get its own real tokens and the padded width of its rows.
+        """
+        encoded, owners = [], []
+        for owner, (query, chunks) in enumerate(requests):
+            query_ids = self.tokenizer(query, add_special_tokens=False, truncation=True,
+                                       max_length=self.max_length)["input_ids"]
+            for key, text in chunks:
+                encoded.append(self._encode_pair(query_ids, self._chunk_ids(key, text)))
+                owners.append(owner)
+        lengths = [len(ids) for ids, _ in encoded]
+
+        flat = np.zeros(len(encoded), dtype=np.float32)
+        usage = [{"tokens": 0, "padded_tokens": 0, "batches": set()} for _ in requests]
+        for b, bucket in enumerate(self._buckets(lengths)):
+            batch_scores = self._forward([encoded[i] for i in bucket])
+            if b == 0 and batch_scores.ndim > 1:
+                # Multi-label heads return one row of scores per pair
+                flat = np.zeros((len(encoded),) + batch_scores.shape[1:], dtype=np.float32)
+            flat[bucket] = batch_scores
+            width = max(lengths[i] for i in bucket)
+            for i in bucket:
+                usage[owners[i]]["tokens"] += lengths[i]
+                usage[owners[i]]["padded_tokens"] += width
+                usage[owners[i]]["batches"].add(b)
+
+        results, start = [], 0
+        for owner, (_, chunks) in enumerate(requests):
+            results.append(flat[start:start + len(chunks)])
+            start += len(chunks)
+            request_stats = stats[owner] if stats else None
+            if request_stats is not None:
+                for key in ("tokens", "padded_tokens"):
+                    request_stats[key] = request_stats.get(key, 0) + usage[owner][key]
+                request_stats["batches"] = request_stats.get("batches", 0) + len(usage[owner]["batches"])
+        return results
+
+    def cache_info(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses}
@@ -0,0 +1,147 @@
+"""
+Local Redis-protocol stand-in for the Medical RAG cache
+Speaks enough RESP2 (PING, GET, SET EX/PX, DEL, EXISTS, SCAN, KEYS, FLUSHDB, SELECT, AUTH) to
+exercise RedisCache, or to share a cache between local workers without installing Redis
+
+Usage:
+    python resp_standin.py --port 6380
+    # RAGConfig.CACHE_BACKEND = "redis"; RAGConfig.CACHE_REDIS_URL = "redis://localhost:6380/0"
+"""
+
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+from typing import Dict, List, Optional, Tuple
+
+
+class _Store:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < time.time():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def live_keys(self) -> List[bytes]:
+        return [k for k in list(self.data) if self.get(k) is not None]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command (e.g. typed into telnet)
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _write(self, value):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(value, bool):
+            self.wfile.write(b"+OK\r\n")
+        elif isinstance(value, int):
+            self.wfile.write(b":%d\r\n" % value)
+        elif isinstance(value, str):
+            self.wfile.write(f"+{value}\r\n".encode("utf-8"))
+        elif isinstance(value, Exception):
+            self.wfile.write(f"-ERR {value}\r\n".encode("utf-8"))
+        elif isinstance(value, list):
+            self.wfile.write(b"*%d\r\n" % len(value))
+            for item in value:
+                self._write(item)
+        else:
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            try:
+                reply = self.server.execute([args[0].upper()] + args[1:])
+            except Exception as e:
+                reply = e
+            self._write(reply)
+            self.wfile.flush()
+
+
+class RESPStandIn(socketserver.ThreadingTCPServer):
+    """In-memory RESP2 server; one shared keyspace (SELECT is accepted and ignored)"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6380):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+
+    def execute(self, args: List[bytes]):
+        command, rest = args[0], args[1:]
+        store = self.store
+        with store.lock:
+            if command == b"PING":
+                return "PONG"
+            if command in (b"SELECT", b"AUTH"):
+                return True
+            if command == b"GET":
+                return store.get(rest[0])
+            if command == b"SET":
+                expires = None
+                options = [a.upper() for a in rest[2:]]
+                if b"EX" in options:
+                    expires = time.time() + float(rest[2 + options.index(b"EX") + 1])
+                if b"PX" in options:
+                    expires = time.time() + float(rest[2 + options.index(b"PX") + 1]) / 1000
+                store.data[rest[0]] = (rest[1], expires)
+                return True
+            if command == b"DEL":
+                return sum(store.data.pop(k, None) is not None for k in rest)
+            if command == b"EXISTS":
+                return sum(store.get(k) is not None for k in rest)
+            if command in (b"KEYS", b"SCAN"):
+                options = [a.upper() for a in rest]
+                pattern = b"*"
+                if command == b"KEYS":
+                    pattern = rest[0]
+                elif b"MATCH" in options:
+                    pattern = rest[options.index(b"MATCH") + 1]
+                keys = [k for k in store.live_keys() if fnmatch.fnmatchcase(k.decode("utf-8"), pattern.decode("utf-8"))]
+                # SCAN returns everything in one page with cursor 0
+                return keys if command == b"KEYS" else [b"0", keys]
+            if command == b"FLUSHDB":
+                store.data.clear()
+                return True
+            raise ValueError(f"unknown command '{command.decode('utf-8', 'replace')}'")
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0) -> RESPStandIn:
+    """Start a stand-in on a background thread (port 0 picks a free port; see server.server_address)"""
+    server = RESPStandIn(host, port)
+    threading.Thread(target=server.serve_forever, name="resp-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for the RAG cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    server = RESPStandIn(args.host, args.port)
+    print(f"RESP stand-in listening on {args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,115 @@
+"""
+Unified multi-domain FAISS index for the Medical RAG pipeline
+All domain vectors live in one index; a parallel domain-id array restricts search to routed domains
+"""
+
+import os
+import json
+import numpy as np
+import faiss
+from typing import Dict, List
+
+from ann_index import read_faiss_index
+
+
+class UnifiedIndex:
+    """
+    One FAISS index holding every domain's chunk vectors.
+
+    Each domain occupies one contiguous block of global ids, so a chunk's
+    global id is ``offset + local id`` and ``domain_ids[global id]`` names
+    its domain. Searches over a subset of domains use an ID selector built
+    from those blocks and fall back to post-filtering on ``domain_ids``.
+
+    On-disk layout:
+        <path>.faiss        the FAISS index
+        <path>.domains.npy  int16[ntotal] domain id per vector
+        <path>.json         domain name -> {"id", "offset", "count"}
+    """
+
+    def __init__(self, index: faiss.Index, domain_ids: np.ndarray, domains: Dict[str, Dict]):
+        self.index = index
+        self.domain_ids = domain_ids
+        self.domains = domains
+        self._names_by_id = {meta["id"]: name for name, meta in domains.items()}
+
+    # --------------------------------------------------------------------
+    # Build / Persistence
+    # --------------------------------------------------------------------
+    @classmethod
+    def empty(cls, dim: int, metric: int = faiss.METRIC_INNER_PRODUCT) -> "UnifiedIndex":
+        return cls(faiss.IndexFlat(dim, metric), np.empty(0, dtype=np.int16), {})
+
+    def append_domain(self, name: str, vectors: np.ndarray):
+        """Append one domain's vectors as a new contiguous block"""
+        if name in self.domains:
+            raise ValueError(f"Domain '{name}' is already in the unified index; rebuild to replace it")
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        domain_id = max((m["id"] for m in self.domains.values()), default=-1) + 1
+        offset = int(self.index.ntotal)
+        self.index.add(vectors)
+        self.domain_ids = np.concatenate([self.domain_ids, np.full(len(vectors), domain_id, dtype=np.int16)])
+        self.domains[name] = {"id": domain_id, "offset": offset, "count": int(len(vectors))}
+        self._names_by_id[domain_id] = name
+
+    def save(self, path: str):
+        faiss.write_index(self.index, f"{path}.faiss")
+        np.save(f"{path}.domains.npy", self.domain_ids)
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(self.domains, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "UnifiedIndex":
+        index = read_faiss_index(f"{path}.faiss", mmap=mmap)
+        domain_ids = np.load(f"{path}.domains.npy", mmap_mode="r")
+        with open(f"{path}.json", encoding="utf-8") as f:
+            domains = json.load(f)
+        return cls(index, domain_ids, domains)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(f"{path}{ext}") for ext in (".faiss", ".domains.npy", ".json"))
+
+    # --------------------------------------------------------------------
+    # Search
+    # --------------------------------------------------------------------
+    def _selector(self, domain_names: List[str]):
+        ranges = [faiss.IDSelectorRange(self.domains[n]["offset"],
+                                        self.domains[n]["offset"] + self.domains[n]["count"])
+                  for n in domain_names]
+        selector, keep_alive = ranges[0], list(ranges)
+        for r in ranges[1:]:
+            selector = faiss.IDSelectorOr(selector, r)
+            keep_alive.append(selector)
+        # SWIG does not own the child selectors, so they must outlive the search
+        return selector, keep_alive
+
+    def search(self, query_emb: np.ndarray, k: int, domain_names: List[str]) -> Dict[str, Dict[int, float]]:
+        """One global top-k over the routed domains -> {domain: {local id: score}}"""
+        names = [n for n in domain_names if n in self.domains]
+        hits = {n: {} for n in names}
+        if not names:
+            return hits
+
+        if len(names) == len(self.domains):
+            D, I = self.index.search(query_emb, k)
+        else:
+            try:
+                selector, _keep_alive = self._selector(names)
+                D, I = self.index.search(query_emb, k, params=faiss.SearchParameters(sel=selector))
+            except (TypeError, RuntimeError):
+                # Index type without selector support: over-fetch and post-filter
+                D, I = self.index.search(query_emb, k * len(self.domains))
+
+        allowed = {self.domains[n]["id"] for n in names}
+        kept = 0
+        for score, gid in zip(D[0], I[0]):
+            if gid < 0 or kept >= k:
+                continue
+            domain_id = int(self.domain_ids[gid])
+            if domain_id not in allowed:
+                continue
+            name = self._names_by_id[domain_id]
+            hits[name][int(gid) - self.domains[name]["offset"]] = float(score)
+            kept += 1
+        return hits
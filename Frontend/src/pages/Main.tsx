@@ -10,6 +10,7 @@ import TypingIndicator from "../components/TypingIndicator";
 import axios from "axios";
 import { Button } from "@/components/ui/button";
 import { useToast } from "@/hooks/use-toast";
+import { streamFromRAG } from "@/services/api";
 
 interface Message {
   text: string;
@@ -120,18 +121,38 @@ const Main: React.FC = () => {
         message: messageText,
       });
 
-      const response = await axios.post("http://127.0.0.1:5000/api/rag/query", {
-        query: messageText,
-        user_id: userId,
-        session_id: currentSessionId,
-      });
+      // Stream the answer: the bubble appears with the first token and grows as tokens arrive
+      let aiResponse = "";
+      let started = false;
+      const showAnswer = (text: string) => {
+        const first = !started;
+        started = true;
+        setIsTyping(false);
+        setMessages((prev) =>
+          first
+            ? [...prev, { text, isUser: false, timestamp: new Date().toISOString() }]
+            : [...prev.slice(0, -1), { ...prev[prev.length - 1], text }]
+        );
+      };
 
-      console.log("🧠 RAG Backend Response:", response.data); // 👈 Optional debug
+      await streamFromRAG(messageText, (event, data) => {
+        if (event === "token") {
+          aiResponse += data.text;
+          showAnswer(aiResponse);
+        } else if (event === "done") {
+          // The final answer is post-processed (cleaned, completed), so it replaces the streamed text
+          aiResponse = data.answer || aiResponse;
+          showAnswer(aiResponse);
+        } else if (event === "error") {
+          aiResponse = `⚠️ ${data.error || "AI could not process your query. Please try again."}`;
+          showAnswer(aiResponse);
+        }
+      });
 
-      // ✅ FIXED: use `answer`, not `response`
-      const aiResponse =
-        response.data.answer ||
-        "AI could not process your query. Please try again.";
+      if (!aiResponse) {
+        aiResponse = "AI could not process your query. Please try again.";
+        showAnswer(aiResponse);
+      }
 
       await axios.post("http://127.0.0.1:5000/api/chat/save", {
         user_id: userId,
@@ -139,11 +160,6 @@ const Main: React.FC = () => {
         role: "assistant",
         message: aiResponse,
       });
-
-      setMessages((prev) => [
-        ...prev,
-        { text: aiResponse, isUser: false, timestamp: new Date().toISOString() },
-      ]);
     } catch (error) {
       console.error("❌ Error communicating with backend:", error);
       setMessages((prev) => [
@@ -24,3 +24,37 @@ export const sendToRAG = async (query) => {
   });
   return res.json();
 };
+
+// Stream an answer from the SSE endpoint; onEvent(event, data) is called for
+// "metadata", "token", "done" and "error" events as they arrive
+export const streamFromRAG = async (query, onEvent) => {
+  const res = await fetch(`${API_URL}/ask/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ query }),
+  });
+  if (!res.ok) {
+    onEvent("error", await res.json());
+    return;
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const messages = buffer.split("\n\n");
+    buffer = messages.pop();
+    for (const message of messages) {
+      let event = "message";
+      let data = "";
+      for (const line of message.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
@@ -17,6 +17,7 @@ from medical_qa_inference import (
     llm_rerank,                    # ADD THIS
     validate_medical_answer,        # ADD THIS
     keyword_score,
+    embed_query,
     MedicalMoE, MedicalExpert,
     GatingNetwork,
     device
@@ -640,7 +641,7 @@ def retrieve_answer_with_context(query, system, memory, k=5):
     # STEP 2: Embed query (NO context added!)
     # ================================================================
     print(f"  2️⃣ Embedding query...")
-    query_emb = embedder.encode([corrected_query], convert_to_numpy=True).astype(np.float32)
+    query_emb = embed_query(embedder, corrected_query)
     
     # ================================================================
     # STEP 3: Route through MoE
@@ -12,6 +12,7 @@ import pickle
 import json
 import os
 import re
+import sys
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import numpy as np
@@ -22,8 +23,13 @@ from datetime import datetime
 # ============================================================================
 
 CHECKPOINT_DIR = "medical_qa_checkpoints"
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 device = torch.device('cpu')
 
+# Query-embedding cache shared with the backend pipeline (Backend/Backend/embedding_cache.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Backend", "Backend"))
+from embedding_cache import shared_embedding_cache
+
 print("="*70)
 print("🏥 MEDICAL QA SYSTEM - FULL PRODUCTION VERSION")
 print("="*70)
@@ -117,7 +123,7 @@ def load_complete_system(checkpoint_name="medical_qa_v1.0"):
     
     # Load embedder
     print("  2️⃣ Loading Embedder...")
-    embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device='cpu')
+    embedder = SentenceTransformer(EMBED_MODEL, device='cpu')
     print(f"     ✓ all-MiniLM-L6-v2 loaded")
     
     # Load MoE model
@@ -184,6 +190,11 @@ def load_complete_system(checkpoint_name="medical_qa_v1.0"):
 # HELPER FUNCTIONS FOR FULL INFERENCE
 # ============================================================================
 
+def embed_query(embedder, query):
+    """Query embedding (1, 384) via the shared LRU cache, keyed on model + normalized text"""
+    return shared_embedding_cache().encode(embedder, EMBED_MODEL, query)
+
+
 def keyword_score(query, answer):
     """Simple keyword scoring"""
     query_words = set(query.lower().split()) - {
@@ -305,7 +316,7 @@ def retrieve_answer_full(query, system, k=5):
     
     # Step 1: Embed query
     print(f"  🔍 Embedding query...")
-    query_emb = embedder.encode([query], convert_to_numpy=True).astype(np.float32)
+    query_emb = embed_query(embedder, query)
     
     # Step 2: Route through MoE
     print(f"  🧭 Routing through MoE...")